@@ -0,0 +1,263 @@
+"""
+bench.py - Local benchmarks for the download engine in fdm.py
+
+Downloads from an HTTP server running in a child process on localhost so
+the numbers measure the client only: throughput, CPU time and the write
+syscalls counted by the kernel (/proc/self/io on Linux).
+"""
+
+import os, time, re, argparse, tempfile, multiprocessing, logging, threading, random, socket
+import http.server
+
+os.environ.setdefault("PYSTRAY_BACKEND", "dummy")  # No tray icon needed
+import fdm
+
+
+class RangeHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    data = b""
+    rate = 0  # Bytes per second per connection, 0 for as fast as possible
+    served = None  # multiprocessing.Value of the body bytes sent, if counted
+
+    def log_message(self, *args):
+        pass
+
+    def send_body_headers(self):
+        total = len(self.data)
+        start, end = 0, total - 1
+        match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)) if match.group(2) else total - 1, total - 1)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{total}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        return start, end
+
+    def do_HEAD(self):
+        self.send_body_headers()
+
+    def do_GET(self):
+        start, end = self.send_body_headers()
+        view = memoryview(self.data)
+        # A paced link sends small blocks on schedule, an unpaced one big blocks
+        block = 65536 if self.rate else 1048576
+        started = time.perf_counter()
+        try:
+            for offset in range(start, end + 1, block):
+                self.wfile.write(view[offset:min(offset + block, end + 1)])
+                if self.served is not None:
+                    with self.served.get_lock():
+                        self.served.value += min(offset + block, end + 1) - offset
+                if self.rate:
+                    delay = started + (offset + block - start) / self.rate - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class QuietServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass  # Clients drop pooled connections on shutdown
+
+
+def serve(size, port_queue, rate=0, address="127.0.0.1", port=0, served=None):
+    # The same bytes in every server process, a download can be spread over several
+    RangeHandler.data = random.Random(size).randbytes(size)
+    RangeHandler.rate = rate
+    RangeHandler.served = served
+    server = QuietServer((address, port), RangeHandler)
+    port_queue.put(server.server_port)
+    server.serve_forever()
+
+
+def start_server(size, rate=0, address="127.0.0.1", port=0, served=None):
+    port_queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=serve, args=(size, port_queue, rate, address, port, served), daemon=True)
+    process.start()
+    return process, port_queue.get()
+
+
+def io_counters():
+    """Kernel read/write syscall counters of this process, empty off Linux"""
+    try:
+        with open("/proc/self/io") as f:
+            return {key: int(value) for key, value in (line.split(": ") for line in f)}
+    except OSError:
+        return {}
+
+
+def timed_download(url, workdir, name, config, num_threads, lookup=None):
+    """Download url once with the given config overrides, returns the measurements.
+
+    lookup replaces getaddrinfo in the manager's resolver.
+    """
+    fdm.DB_FILE = os.path.join(workdir, name + ".db")
+    manager = fdm.DownloadManager()
+    manager.config.update(config, save_path=workdir)
+    if lookup:
+        manager.resolver.lookup = lookup
+
+    io_before = io_counters()
+    cpu_before = time.process_time()
+    started = time.perf_counter()
+
+    # The callbacks run once the file is renamed and recorded in the database
+    finished = threading.Event()
+    key = manager.create_multi_threaded_download(url, file_name=name, num_threads=num_threads,
+                                                 complete_callback=lambda url: finished.set(),
+                                                 error_callback=lambda error: finished.set())
+    download = manager.downloads[key]
+    part_file = manager.get_part_file(download["temp_path"])
+    manager.start_download(key)
+    finished.wait()
+
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu_before
+    io_after = io_counters()
+    manager.shutdown()
+    manager.db.conn.close()
+
+    if download["status"] != "completed":
+        raise RuntimeError(f"Download of {name} failed")
+    os.remove(os.path.join(workdir, name))
+    return {
+        "seconds": elapsed,
+        "cpu": cpu,
+        "write_syscalls": io_after.get("syscw", 0) - io_before.get("syscw", 0),
+        "syncs": part_file.get_stats()["fsyncs"],
+        "failed_addresses": sorted(manager.resolver.failures)
+    }
+
+
+def bench_storage(args):
+    """Positional writes against the mmap backend for one segmented download"""
+    size = args.size * 1024 * 1024
+    server, port = start_server(size)
+    url = f"http://127.0.0.1:{port}/bench.bin"
+
+    print(f"{args.size} MB, {args.segments} segments, fsync policy {args.fsync_policy}, best of {args.runs}")
+    print(f"{'backend':<10}{'MB/s':>10}{'CPU s':>10}{'write syscalls':>16}{'syncs':>8}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for backend in ("file", "mmap"):
+            config = {
+                "storage_backend": backend,
+                "fsync_policy": args.fsync_policy,
+                "min_segment_size": 1024 * 1024,
+                "max_connections": args.segments
+            }
+            runs = [timed_download(url, workdir, f"{backend}-{run}.bin", config, args.segments)
+                    for run in range(args.runs)]
+            best = min(runs, key=lambda result: result["seconds"])
+            print(f"{backend:<10}{args.size / best['seconds']:>10.1f}{best['cpu']:>10.2f}"
+                  f"{best['write_syscalls']:>16}{best['syncs']:>8}")
+    server.terminate()
+
+
+def bench_chunks(args):
+    """CPU per GB of the AUTO read size against fixed 64 KiB reads at several link speeds"""
+    size = args.size * 1024 * 1024
+    print(f"{args.size} MB, {args.segments} segments, best of {args.runs}")
+    print(f"{'link':<12}{'chunk':<8}{'MB/s':>10}{'CPU s/GB':>10}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for speed in args.speeds:
+            # The link speed is split evenly over the segments' connections
+            server, port = start_server(size, speed * 1024 * 1024 // args.segments)
+            url = f"http://127.0.0.1:{port}/bench.bin"
+            for chunk_size in (65536, "AUTO"):
+                config = {
+                    "chunk_size": chunk_size,
+                    "min_segment_size": 1024 * 1024,
+                    "max_connections": args.segments
+                }
+                runs = [timed_download(url, workdir, f"{chunk_size}-{run}.bin", config, args.segments)
+                        for run in range(args.runs)]
+                best = min(runs, key=lambda result: result["cpu"])
+                link = f"{speed} MB/s" if speed else "unlimited"
+                print(f"{link:<12}{str(chunk_size):<8}{args.size / best['seconds']:>10.1f}"
+                      f"{best['cpu'] * 1024 / args.size:>10.2f}")
+            server.terminate()
+
+
+def bench_addresses(args):
+    """One host name resolving to several loopback listeners, some of them refusing connections.
+
+    Shows how the segments spread over the addresses and that connects
+    fall back from the dead ones. Linux routes all of 127.0.0.0/8 to the
+    loopback interface, elsewhere the extra addresses have to be added first.
+    """
+    size = args.size * 1024 * 1024
+    live = [f"127.0.0.{index + 1}" for index in range(len(args.speeds))]
+    dead = [f"127.0.0.{index + 101}" for index in range(args.dead)]
+    counters = {address: multiprocessing.Value("q", 0) for address in live}
+    servers, port = [], 0
+    for address, speed in zip(live, args.speeds):
+        server, port = start_server(size, speed * 1024 * 1024, address, port, counters[address])
+        servers.append(server)
+
+    def lookup(host, port, *rest):
+        # The dead addresses come first, every new connection has to get past them
+        return [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, "", (address, port))
+                for address in dead + live]
+
+    url = f"http://bench.test:{port}/bench.bin"
+    speeds = ", ".join(f"{address} {speed or 'unlimited'}" for address, speed in zip(live, args.speeds))
+    print(f"{args.size} MB, {args.segments} segments, MB/s per connection: {speeds}, refusing: {', '.join(dead) or 'none'}")
+    print(f"{'engine':<10}{'MB/s':>8}  {'failed connects':<20}MB served per address")
+    with tempfile.TemporaryDirectory() as workdir:
+        for engine in ("threads", "asyncio"):
+            for counter in counters.values():
+                counter.value = 0
+            config = {
+                "engine": engine,
+                "min_segment_size": 1024 * 1024,
+                "max_connections": args.segments
+            }
+            result = timed_download(url, workdir, f"{engine}.bin", config, args.segments, lookup)
+            served = "  ".join(f"{address} {counter.value / 1024 / 1024:.1f}" for address, counter in counters.items())
+            print(f"{engine:<10}{args.size / result['seconds']:>8.1f}  "
+                  f"{', '.join(result['failed_addresses']) or 'none':<20}{served}")
+    for server in servers:
+        server.terminate()
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='FDM engine benchmarks')
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    storage = commands.add_parser("storage", help="Compare the file and mmap storage backends")
+    storage.add_argument("--size", type=int, default=256, help="File size in MB")
+    storage.add_argument("--segments", type=int, default=8, help="Segments per download")
+    storage.add_argument("--runs", type=int, default=3, help="Runs per backend, the fastest is shown")
+    storage.add_argument("--fsync-policy", default="checkpoint", choices=["never", "size", "checkpoint"])
+    storage.set_defaults(run=bench_storage)
+
+    chunks = commands.add_parser("chunks", help="Compare the AUTO chunk size with fixed 64 KiB reads")
+    chunks.add_argument("--size", type=int, default=128, help="File size in MB")
+    chunks.add_argument("--segments", type=int, default=4, help="Segments per download")
+    chunks.add_argument("--runs", type=int, default=3, help="Runs per chunk size, the one with the least CPU is shown")
+    chunks.add_argument("--speeds", type=int, nargs="+", default=[10, 100, 0],
+                        help="Link speeds in MB/s to emulate, 0 for unlimited")
+    chunks.set_defaults(run=bench_chunks)
+
+    addresses = commands.add_parser("addresses", help="Spread segments over several addresses of one host")
+    addresses.add_argument("--size", type=int, default=64, help="File size in MB")
+    addresses.add_argument("--segments", type=int, default=6, help="Segments per download")
+    addresses.add_argument("--speeds", type=int, nargs="+", default=[40, 20, 5],
+                           help="MB/s per connection of each listening address, 0 for unlimited")
+    addresses.add_argument("--dead", type=int, default=1, help="Addresses that refuse connections")
+    addresses.set_defaults(run=bench_addresses)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.WARNING)
+    args = parse_arguments()
+    args.run(args)
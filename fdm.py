@@ -5,7 +5,7 @@ import requests
 import os
 import time
 import threading
-from urllib.parse import urlparse
+from urllib.parse import urlparse, urljoin
 import json
 from datetime import datetime
 import math
@@ -17,10 +17,93 @@ import sqlite3
 import argparse
 import logging
 import tempfile
+import asyncio
+import ssl
+import random
+import errno
+import http.client
+import mmap
+import hashlib
+import shutil
+import tarfile
+import zipfile
+import concurrent.futures
+import socket
+import selectors
+import urllib3
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows
+try:
+    import zstandard  # Optional, for .tar.zst archives
+except ImportError:
+    zstandard = None
+try:
+    import ctypes
+    # glibc's posix_fallocate writes every block where the filesystem has no fallocate
+    libc_fallocate = ctypes.CDLL(None, use_errno=True).fallocate64 if sys.platform.startswith("linux") else None
+    if libc_fallocate is not None:
+        libc_fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+except (ImportError, OSError, AttributeError):
+    libc_fallocate = None
 
 # Constants
 DEFAULT_CHUNK_SIZE = 65536
 MAX_CONNECTIONS = 8
+THREADS_PER_DOWNLOAD = 4
+MIN_SEGMENT_SIZE = 1048576  # Don't split files into segments smaller than 1 MB
+PROGRESS_FLUSH_INTERVAL = 1.0  # Seconds between batched progress writes
+POOL_IDLE_TIMEOUT = 60  # Seconds before an unused host session is closed
+PAUSE_GRACE_PERIOD = 15  # Seconds a paused transfer keeps its connection open
+WRITE_BUFFER_SIZE = 8 * 1024 * 1024  # Write-behind buffer per .part file
+FSYNC_INTERVAL = 64 * 1024 * 1024  # Bytes between fsyncs with the "size" policy
+BUFFER_POOL_SIZE = 64 * 1024 * 1024  # Free receive buffers kept for reuse
+IOV_MAX = 1024  # Buffers per os.pwritev call
+WRITER_THREADS = 4  # Threads writing the buffers of every .part file between them
+MAX_RETRIES = 5  # Consecutive failed attempts before a transfer gives up
+RETRY_BASE_DELAY = 1  # Seconds before the first retry, doubled on each failure
+RETRY_MAX_DELAY = 60
+RETRY_STATUS_CODES = (408, 429)  # Retried along with every 5xx
+RATE_LIMIT_BURST = 0.1  # Seconds of traffic a rate limiter lets through at once
+MAX_ACTIVE_DOWNLOADS = 3
+MAX_DOWNLOADS_PER_HOST = 2
+FICLONE = 0x40049409  # Linux ioctl that makes a copy-on-write clone of a file
+HASH_READ_SIZE = 1024 * 1024  # Bytes read back per step when hashing from disk
+PROBE_CACHE_TTL = 300  # Seconds a URL's probe result is reused by later adds
+PROBE_WORKERS = 8  # Concurrent probes when many URLs are added at once
+DNS_CACHE_TTL = 60  # Seconds a resolved host name is reused
+HAPPY_EYEBALLS_DELAY = 0.25  # Seconds before the next address is tried alongside a slow connect
+ADDRESS_RETRY_DELAY = 30  # Seconds an address that failed to connect is tried last
+HOST_SLOT_POLL_INTERVAL = 0.05  # Seconds between tries of an async transfer waiting for a free host connection
+MIRROR_STALL_TIMEOUT = 20  # Seconds without data before a segment moves to another mirror
+MIRROR_RETRY_DELAY = 60  # Seconds a mirror that failed or stalled gets no new segments
+MAX_TOTAL_CONNECTIONS = 32  # Segment connections of all downloads together, for auto tuning
+AUTO_START_CONNECTIONS = 2  # Segments an auto-tuned download starts with
+AUTO_TUNE_INTERVAL = 2.0  # Seconds of throughput measured per tuning step
+AUTO_TUNE_GAIN = 0.1  # Throughput gain an added connection has to bring to stay
+AUTO_TUNE_HOLD = 10  # Seconds without adding connections after backing off
+AUTO_TUNE_HISTORY = 20  # Tuning steps kept for the details view
+AUTO_READ_TIME = 0.1  # Seconds an AUTO-sized read should take
+AUTO_MIN_READ_SIZE = 16384
+AUTO_MAX_READ_SIZE = 4 * 1024 * 1024  # Also at most an eighth of the .part file's write buffer
+
+# Archives that can be extracted while they download, by file name suffix
+ARCHIVE_TYPES = [
+    (".tar.gz", "r|gz"), (".tgz", "r|gz"), (".tar.bz2", "r|bz2"), (".tbz2", "r|bz2"),
+    (".tar.xz", "r|xz"), (".txz", "r|xz"), (".tar.zst", "zst"), (".tzst", "zst"),
+    (".tar", "r|"), (".zip", "zip")
+]
+
+# Checksums users can attach to a download, by hex digest length
+CHECKSUM_ALGORITHMS = {"sha256": 64, "sha1": 40, "md5": 32}
+
+# Download priorities, lower runs first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+PRIORITIES = {"high": PRIORITY_HIGH, "normal": PRIORITY_NORMAL, "low": PRIORITY_LOW}
+PRIORITY_NAMES = {value: name for name, value in PRIORITIES.items()}
 CONFIG_FILE = "downloader_config.json"
 DB_FILE = "downloads.db"
 
@@ -39,6 +122,10 @@ class DownloadDB:
     def __init__(self):
         self.conn = sqlite3.connect(DB_FILE, check_same_thread=False)
         self.conn.execute("PRAGMA journal_mode=WAL")  # Better concurrency
+        self.lock = threading.RLock()  # The connection is shared by all threads
+        self.pending_lock = threading.Lock()
+        self.pending_progress = {}  # download_id -> latest (downloaded, total_size, speed, status)
+        self.pending_segments = {}  # download_id -> latest [(start_byte, end_byte, position), ...]
         self.create_tables()
         
     def create_tables(self):
@@ -60,6 +147,16 @@ class DownloadDB:
             )
         ''')
         
+        # Columns added after the first release
+        self.add_column(cursor, "downloads", "priority", f"INTEGER DEFAULT {PRIORITY_NORMAL}")
+        self.add_column(cursor, "downloads", "speed_limit", "INTEGER")
+        self.add_column(cursor, "downloads", "storage", "TEXT")
+        self.add_column(cursor, "downloads", "expected_checksum", "TEXT")
+        self.add_column(cursor, "downloads", "checksum", "TEXT")
+        self.add_column(cursor, "downloads", "etag", "TEXT")
+        self.add_column(cursor, "downloads", "last_modified", "TEXT")
+        self.add_column(cursor, "downloads", "extract", "INTEGER DEFAULT 0")
+        
         # Download sessions table for tracking speed over time
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS download_sessions (
@@ -73,6 +170,32 @@ class DownloadDB:
             )
         ''')
         
+        # Segment map for resuming segmented downloads, position is the
+        # next byte to write so a range is done once position > end_byte
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS download_segments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                download_id INTEGER,
+                start_byte INTEGER NOT NULL,
+                end_byte INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                FOREIGN KEY (download_id) REFERENCES downloads (id)
+            )
+        ''')
+        
+        # Other URLs of the same file a segmented download also fetches from,
+        # with the validators each one reported
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS download_mirrors (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                download_id INTEGER,
+                url TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                FOREIGN KEY (download_id) REFERENCES downloads (id)
+            )
+        ''')
+        
         # Stats table for overall statistics
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS stats (
@@ -84,6 +207,24 @@ class DownloadDB:
             )
         ''')
         
+        # Completed files by what identifies their content, so a later download
+        # of the same content can link to the file instead of fetching it
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS file_index (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                size INTEGER NOT NULL,
+                checksum TEXT,
+                path TEXT NOT NULL,
+                mtime REAL NOT NULL,
+                added_date DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS file_index_url ON file_index (url)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS file_index_checksum ON file_index (checksum)")
+        
         # Settings table to replace JSON config
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS settings (
@@ -105,7 +246,28 @@ class DownloadDB:
             ('chunk_size', str(DEFAULT_CHUNK_SIZE)),
             ('timeout', '30'),
             ('theme', 'light'),
-            ('proxy', '')
+            ('proxy', ''),
+            ('threads_per_download', str(THREADS_PER_DOWNLOAD)),
+            ('min_segment_size', str(MIN_SEGMENT_SIZE)),
+            ('progress_flush_interval', str(PROGRESS_FLUSH_INTERVAL)),
+            ('pool_idle_timeout', str(POOL_IDLE_TIMEOUT)),
+            ('engine', 'threads'),
+            ('max_active_downloads', str(MAX_ACTIVE_DOWNLOADS)),
+            ('max_downloads_per_host', str(MAX_DOWNLOADS_PER_HOST)),
+            ('pause_grace_period', str(PAUSE_GRACE_PERIOD)),
+            ('write_buffer_size', str(WRITE_BUFFER_SIZE)),
+            ('fsync_policy', 'checkpoint'),
+            ('receive_mode', 'readinto'),
+            ('storage_backend', 'file'),
+            ('fsync_interval', str(FSYNC_INTERVAL // (1024 * 1024))),
+            ('global_speed_limit', '0'),
+            ('download_speed_limit', '0'),
+            ('probe_cache_ttl', str(PROBE_CACHE_TTL)),
+            ('probe_workers', str(PROBE_WORKERS)),
+            ('dns_cache_ttl', str(DNS_CACHE_TTL)),
+            ('mirror_stall_timeout', str(MIRROR_STALL_TIMEOUT)),
+            ('connection_tuning', 'fixed'),
+            ('max_total_connections', str(MAX_TOTAL_CONNECTIONS))
         ]
         
         for key, value in default_settings:
@@ -116,80 +278,220 @@ class DownloadDB:
             
         self.conn.commit()
         
+    def add_column(self, cursor, table, column, definition):
+        """Add a column to a table created by an older version"""
+        cursor.execute(f"PRAGMA table_info({table})")
+        if column not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            
     def add_download(self, url, filename, save_path):
-        cursor = self.conn.cursor()
-        cursor.execute(
-            "INSERT INTO downloads (url, filename, save_path) VALUES (?, ?, ?)",
-            (url, filename, save_path)
-        )
-        self.conn.commit()
-        return cursor.lastrowid
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                "INSERT INTO downloads (url, filename, save_path) VALUES (?, ?, ?)",
+                (url, filename, save_path)
+            )
+            self.conn.commit()
+            return cursor.lastrowid
     
-    def update_download_progress(self, download_id, downloaded, total_size, status, speed=0):
-        cursor = self.conn.cursor()
+    def add_downloads(self, rows):
+        """Insert many new downloads in one transaction, returns their ids in row order.
         
-        # Start a transaction
-        cursor.execute("BEGIN TRANSACTION")
-        
-        try:
-            # Update download record
-            cursor.execute(
-                "UPDATE downloads SET downloaded = ?, total_size = ?, status = ? WHERE id = ?",
-                (downloaded, total_size, status, download_id)
+        rows are (url, filename, save_path, total_size, etag, last_modified, storage, extract).
+        """
+        if not rows:
+            return []
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.executemany(
+                "INSERT INTO downloads (url, filename, save_path, total_size, etag, last_modified, storage, extract) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
             )
-            
-            # Update or create download session
+            # Ids are handed out in order and the lock keeps other inserts out
+            cursor.execute("SELECT id FROM downloads ORDER BY id DESC LIMIT ?", (len(rows),))
+            ids = [row[0] for row in reversed(cursor.fetchall())]
+            self.conn.commit()
+            return ids
+    
+    def queue_progress(self, download_id, downloaded, total_size, speed=0):
+        """Record the latest offset for a download, written by the next flush"""
+        with self.pending_lock:
+            # Keep a status change that hasn't been flushed yet
+            previous = self.pending_progress.get(download_id)
+            status = previous[3] if previous else None
+            self.pending_progress[download_id] = (downloaded, total_size, speed, status)
+    
+    def queue_segments(self, download_id, segments):
+        """Record the latest segment map for a download, written by the next flush"""
+        with self.pending_lock:
+            self.pending_segments[download_id] = segments
+    
+    def get_segments(self, download_id):
+        with self.lock:
+            cursor = self.conn.cursor()
             cursor.execute(
-                "SELECT id FROM download_sessions WHERE download_id = ? AND end_time IS NULL",
+                "SELECT start_byte, end_byte, position FROM download_segments WHERE download_id = ? ORDER BY start_byte",
                 (download_id,)
             )
-            session = cursor.fetchone()
-            
-            if session:
-                session_id = session[0]
-                cursor.execute(
-                    "UPDATE download_sessions SET downloaded_bytes = ?, average_speed = ? WHERE id = ?",
-                    (downloaded, speed, session_id)
-                )
-            else:
-                cursor.execute(
-                    "INSERT INTO download_sessions (download_id, downloaded_bytes, average_speed) VALUES (?, ?, ?)",
-                    (download_id, downloaded, speed)
-                )
-                
-            self.conn.commit()
-        except Exception as e:
-            self.conn.rollback()
-            raise e
-        
-    def complete_download(self, download_id, average_speed):
-        cursor = self.conn.cursor()
-        
-        # Start a transaction
-        cursor.execute("BEGIN TRANSACTION")
-        
-        try:
-            # Update download record
+            return cursor.fetchall()
+    
+    def add_linked_download(self, url, filename, save_path, size):
+        """Row for a download that was served from an identical local file"""
+        with self.lock:
+            cursor = self.conn.cursor()
             cursor.execute(
-                "UPDATE downloads SET status = 'completed', completed_date = CURRENT_TIMESTAMP, average_speed = ? WHERE id = ?",
-                (average_speed, download_id)
+                "INSERT INTO downloads (url, filename, save_path, total_size, downloaded, status, completed_date) "
+                "VALUES (?, ?, ?, ?, ?, 'completed', CURRENT_TIMESTAMP)",
+                (url, filename, save_path, size, size)
             )
+            self.conn.commit()
+            return cursor.lastrowid
             
-            # End the download session
+    def index_file(self, url, etag, last_modified, size, checksum, path, mtime):
+        with self.lock:
+            cursor = self.conn.cursor()
+            # A new file at a path replaces whatever was indexed there
+            cursor.execute("DELETE FROM file_index WHERE path = ?", (path,))
             cursor.execute(
-                "UPDATE download_sessions SET end_time = CURRENT_TIMESTAMP WHERE download_id = ? AND end_time IS NULL",
-                (download_id,)
+                "INSERT INTO file_index (url, etag, last_modified, size, checksum, path, mtime) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, size, checksum, path, mtime)
             )
+            self.conn.commit()
             
-            # Update stats
+    def find_indexed_files(self, url, checksum=None):
+        """Indexed files fetched from url or with the given checksum, newest first"""
+        with self.lock:
+            cursor = self.conn.cursor()
             cursor.execute(
-                "UPDATE stats SET total_downloads = total_downloads + 1, last_updated = CURRENT_TIMESTAMP"
+                "SELECT id, url, etag, last_modified, size, checksum, path, mtime FROM file_index "
+                "WHERE url = ? OR checksum = ? ORDER BY id DESC",
+                (url, checksum)
             )
+            return cursor.fetchall()
+            
+    def get_indexed_files(self):
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT id, size, path, mtime FROM file_index")
+            return cursor.fetchall()
             
+    def remove_indexed_files(self, index_ids):
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.executemany("DELETE FROM file_index WHERE id = ?", [(index_id,) for index_id in index_ids])
             self.conn.commit()
-        except Exception as e:
-            self.conn.rollback()
-            raise e
+            
+    def find_unfinished_download(self, url, filename, save_path):
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                "SELECT id, total_size, downloaded FROM downloads WHERE url = ? AND filename = ? AND save_path = ? "
+                "AND status != 'completed' ORDER BY id DESC LIMIT 1",
+                (url, filename, save_path)
+            )
+            return cursor.fetchone()
+    
+    def update_download_progress(self, download_id, downloaded, total_size, status, speed=0):
+        """Write a state change right away, together with all queued progress"""
+        with self.pending_lock:
+            self.pending_progress[download_id] = (downloaded, total_size, speed, status)
+        self.flush_progress()
+        
+    def flush_progress(self):
+        with self.lock:
+            with self.pending_lock:
+                pending, self.pending_progress = self.pending_progress, {}
+                pending_segments, self.pending_segments = self.pending_segments, {}
+            if not pending and not pending_segments:
+                return
+                
+            cursor = self.conn.cursor()
+            
+            # Start a transaction
+            cursor.execute("BEGIN TRANSACTION")
+            
+            try:
+                for download_id, (downloaded, total_size, speed, status) in pending.items():
+                    # Update download record
+                    if status is None:
+                        cursor.execute(
+                            "UPDATE downloads SET downloaded = ?, total_size = ? WHERE id = ?",
+                            (downloaded, total_size, download_id)
+                        )
+                    else:
+                        cursor.execute(
+                            "UPDATE downloads SET downloaded = ?, total_size = ?, status = ? WHERE id = ?",
+                            (downloaded, total_size, status, download_id)
+                        )
+                    
+                    # Update or create download session
+                    cursor.execute(
+                        "SELECT id FROM download_sessions WHERE download_id = ? AND end_time IS NULL",
+                        (download_id,)
+                    )
+                    session = cursor.fetchone()
+                    
+                    if session:
+                        session_id = session[0]
+                        cursor.execute(
+                            "UPDATE download_sessions SET downloaded_bytes = ?, average_speed = ? WHERE id = ?",
+                            (downloaded, speed, session_id)
+                        )
+                    else:
+                        cursor.execute(
+                            "INSERT INTO download_sessions (download_id, downloaded_bytes, average_speed) VALUES (?, ?, ?)",
+                            (download_id, downloaded, speed)
+                        )
+                        
+                # Replace segment maps
+                for download_id, segments in pending_segments.items():
+                    cursor.execute("DELETE FROM download_segments WHERE download_id = ?", (download_id,))
+                    cursor.executemany(
+                        "INSERT INTO download_segments (download_id, start_byte, end_byte, position) VALUES (?, ?, ?, ?)",
+                        [(download_id, start_byte, end_byte, position) for start_byte, end_byte, position in segments]
+                    )
+                    
+                self.conn.commit()
+            except Exception as e:
+                self.conn.rollback()
+                raise e
+        
+    def complete_download(self, download_id, average_speed):
+        # Write everything still queued before closing the session
+        self.flush_progress()
+        
+        with self.lock:
+            cursor = self.conn.cursor()
+            
+            # Start a transaction
+            cursor.execute("BEGIN TRANSACTION")
+            
+            try:
+                # Update download record
+                cursor.execute(
+                    "UPDATE downloads SET status = 'completed', downloaded = total_size, completed_date = CURRENT_TIMESTAMP, average_speed = ? WHERE id = ?",
+                    (average_speed, download_id)
+                )
+                
+                # End the download session
+                cursor.execute(
+                    "UPDATE download_sessions SET end_time = CURRENT_TIMESTAMP WHERE download_id = ? AND end_time IS NULL",
+                    (download_id,)
+                )
+                
+                # The segment map is only needed to resume
+                cursor.execute("DELETE FROM download_segments WHERE download_id = ?", (download_id,))
+                
+                # Update stats
+                cursor.execute(
+                    "UPDATE stats SET total_downloads = total_downloads + 1, last_updated = CURRENT_TIMESTAMP"
+                )
+                
+                self.conn.commit()
+            except Exception as e:
+                self.conn.rollback()
+                raise e
         
     def get_download_history(self):
         cursor = self.conn.cursor()
@@ -211,9 +513,117 @@ class DownloadDB:
         return cursor.fetchone()
     
     def update_overall_speed(self, average_speed):
-        cursor = self.conn.cursor()
-        cursor.execute("UPDATE stats SET average_speed = ?", (average_speed,))
-        self.conn.commit()
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute("UPDATE stats SET average_speed = ?", (average_speed,))
+            self.conn.commit()
+    
+    def set_validators(self, download_id, etag, last_modified):
+        """ETag and Last-Modified of the remote file the .part data comes from"""
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute("UPDATE downloads SET etag = ?, last_modified = ? WHERE id = ?",
+                           (etag, last_modified, download_id))
+            self.conn.commit()
+            
+    def get_validators(self, download_id):
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT etag, last_modified FROM downloads WHERE id = ?", (download_id,))
+            result = cursor.fetchone()
+            return result if result else (None, None)
+            
+    def set_mirrors(self, download_id, mirrors):
+        """Replace the mirrors of a download, mirrors maps URL -> (etag, last_modified)"""
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute("DELETE FROM download_mirrors WHERE download_id = ?", (download_id,))
+            cursor.executemany(
+                "INSERT INTO download_mirrors (download_id, url, etag, last_modified) VALUES (?, ?, ?, ?)",
+                [(download_id, url, etag, last_modified) for url, (etag, last_modified) in mirrors.items()]
+            )
+            self.conn.commit()
+            
+    def get_mirrors(self, download_id):
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT url, etag, last_modified FROM download_mirrors WHERE download_id = ? ORDER BY id",
+                           (download_id,))
+            return {url: (etag, last_modified) for url, etag, last_modified in cursor.fetchall()}
+            
+    def set_extract(self, download_id, extract):
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute("UPDATE downloads SET extract = ? WHERE id = ?", (int(extract), download_id))
+            self.conn.commit()
+            
+    def get_extract(self, download_id):
+        """Whether the download's archive is unpacked as it arrives"""
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT extract FROM downloads WHERE id = ?", (download_id,))
+            result = cursor.fetchone()
+            return bool(result and result[0])
+            
+    def set_expected_checksum(self, download_id, checksum):
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute("UPDATE downloads SET expected_checksum = ? WHERE id = ?", (checksum, download_id))
+            self.conn.commit()
+            
+    def get_expected_checksum(self, download_id):
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT expected_checksum FROM downloads WHERE id = ?", (download_id,))
+            result = cursor.fetchone()
+            return result[0] if result else None
+            
+    def set_checksum(self, download_id, checksum):
+        """Digest of the finished file, only stored once it matched the expected one"""
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute("UPDATE downloads SET checksum = ? WHERE id = ?", (checksum, download_id))
+            self.conn.commit()
+            
+    def set_storage(self, download_id, storage):
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute("UPDATE downloads SET storage = ? WHERE id = ?", (storage, download_id))
+            self.conn.commit()
+            
+    def get_storage(self, download_id):
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT storage FROM downloads WHERE id = ?", (download_id,))
+            result = cursor.fetchone()
+            return result[0] if result else None
+            
+    def set_priority(self, download_id, priority):
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute("UPDATE downloads SET priority = ? WHERE id = ?", (priority, download_id))
+            self.conn.commit()
+            
+    def get_priority(self, download_id):
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT priority FROM downloads WHERE id = ?", (download_id,))
+            result = cursor.fetchone()
+            return result[0] if result and result[0] is not None else PRIORITY_NORMAL
+    
+    def set_speed_limit(self, download_id, speed_limit):
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute("UPDATE downloads SET speed_limit = ? WHERE id = ?", (speed_limit, download_id))
+            self.conn.commit()
+            
+    def get_speed_limit(self, download_id):
+        """Per-download limit in KB/s, None when the download uses the default"""
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT speed_limit FROM downloads WHERE id = ?", (download_id,))
+            result = cursor.fetchone()
+            return result[0] if result else None
     
     def get_setting(self, key):
         cursor = self.conn.cursor()
@@ -222,17 +632,1193 @@ class DownloadDB:
         return result[0] if result else None
     
     def set_setting(self, key, value):
-        cursor = self.conn.cursor()
-        cursor.execute(
-            "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
-            (key, str(value))
-        )
-        self.conn.commit()
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                (key, str(value))
+            )
+            self.conn.commit()
+
+
+class ProgressWriter(threading.Thread):
+    """Flushes queued download progress to the database in one transaction per interval"""
+    def __init__(self, db, interval=1.0, checkpoint=None):
+        super().__init__(daemon=True)
+        self.db = db
+        self.interval = interval
+        self.checkpoint = checkpoint  # Called before each flush to make file data durable
+        self._stop_event = threading.Event()
+        
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.flush()
+                
+    def flush(self):
+        # Queued offsets are durable already, a failed checkpoint must not hold them back
+        if self.checkpoint:
+            try:
+                self.checkpoint()
+            except Exception as e:
+                logger.error(f"Error checkpointing downloads: {str(e)}")
+        try:
+            self.db.flush_progress()
+        except Exception as e:
+            logger.error(f"Error writing download progress: {str(e)}")
+                
+    def stop(self):
+        self._stop_event.set()
+        self.flush()
+
+
+class Resolver:
+    """DNS cache shared by every connection, connects Happy Eyeballs style across a host's addresses"""
+    def __init__(self, ttl=DNS_CACHE_TTL, lookup=socket.getaddrinfo):
+        self.ttl = ttl
+        self.lookup = lookup
+        self.entries = {}  # (host, port) -> (expires, [(family, sockaddr), ...])
+        self.failures = {}  # address -> time its last connect failed
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        
+    def resolve(self, host, port):
+        """(family, sockaddr) pairs of host, IPv6 and IPv4 interleaved as RFC 8305 asks"""
+        addresses = self.cached(host, port)
+        if addresses is not None:
+            return addresses
+        with self.lock:
+            self.misses += 1
+        # getaddrinfo doesn't tell the record TTL, the configured one is used instead
+        results = list(dict.fromkeys((family, sockaddr) for family, _, _, _, sockaddr
+                                     in self.lookup(host, port, 0, socket.SOCK_STREAM)))
+        first = [result for result in results if result[0] == results[0][0]]
+        other = [result for result in results if result[0] != results[0][0]]
+        addresses = [result for pair in zip(first, other) for result in pair]
+        addresses += first[len(other):] + other[len(first):]
+        with self.lock:
+            self.entries[(host, port)] = (time.time() + self.ttl, addresses)
+        return list(addresses)
+        
+    def cached(self, host, port):
+        """What resolve() would return if it can answer from the cache, None otherwise"""
+        with self.lock:
+            entry = self.entries.get((host, port))
+            if entry and entry[0] > time.time():
+                self.hits += 1
+                return list(entry[1])
+            return None
+            
+    def cached_addresses(self, host, port):
+        """IP addresses of host in connect order if it was resolved lately, never blocks on DNS"""
+        with self.lock:
+            entry = self.entries.get((host, port))
+            if not entry or entry[0] <= time.time():
+                return []
+            return [sockaddr[0] for family, sockaddr in entry[1]]
+        
+    def invalidate(self, host, port):
+        with self.lock:
+            self.entries.pop((host, port), None)
+            
+    def is_failing(self, address):
+        with self.lock:
+            return time.time() - self.failures.get(address, 0) < ADDRESS_RETRY_DELAY
+            
+    def connect(self, host, port, timeout=None, address=None, socket_options=None):
+        """Connected socket to host, to address first if given and the other addresses as fallback"""
+        addresses = self.connect_order(self.resolve(host, port), address)
+        try:
+            return self.happy_eyeballs(addresses, timeout, socket_options)
+        except OSError:
+            self.invalidate(host, port)  # Maybe the records moved, look them up again next time
+            raise
+            
+    async def connect_async(self, host, port, timeout=None, address=None, socket_options=None):
+        """connect() for an event loop, returns a non-blocking socket"""
+        addresses = self.cached(host, port)
+        if addresses is None:
+            # getaddrinfo blocks, asyncio itself looks names up on a worker thread too
+            addresses = await asyncio.to_thread(self.resolve, host, port)
+        addresses = self.connect_order(addresses, address)
+        try:
+            return await asyncio.wait_for(self.happy_eyeballs_async(addresses, socket_options), timeout)
+        except (OSError, asyncio.TimeoutError):
+            self.invalidate(host, port)
+            raise
+            
+    def connect_order(self, addresses, address=None):
+        # Addresses that failed lately go last, a pinned one goes first
+        return sorted(addresses, key=lambda item: (item[1][0] != address, self.is_failing(item[1][0])))
+            
+    def happy_eyeballs(self, addresses, timeout, socket_options):
+        """Start a connect to the next address every HAPPY_EYEBALLS_DELAY seconds, the first one up wins"""
+        deadline = time.monotonic() + timeout if timeout else None
+        selector = selectors.DefaultSelector()
+        pending = []
+        error = OSError("No addresses to connect to")
+        next_attempt = 0
+        try:
+            while addresses or pending:
+                now = time.monotonic()
+                if deadline and now >= deadline:
+                    raise socket.timeout("Connect timed out")
+                if addresses and (not pending or now >= next_attempt):
+                    family, sockaddr = addresses.pop(0)
+                    sock = socket.socket(family, socket.SOCK_STREAM)
+                    for option in socket_options or []:
+                        sock.setsockopt(*option)
+                    sock.setblocking(False)
+                    result = sock.connect_ex(sockaddr)
+                    if result not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                        error = self.connect_failed(sock, sockaddr, result)
+                        continue
+                    selector.register(sock, selectors.EVENT_WRITE, sockaddr)
+                    pending.append(sock)
+                    next_attempt = now + HAPPY_EYEBALLS_DELAY
+                    
+                wait = [limit - now for limit in (deadline, next_attempt if addresses else None) if limit]
+                for key, _ in selector.select(max(0, min(wait)) if wait else None):
+                    sock, sockaddr = key.fileobj, key.data
+                    selector.unregister(sock)
+                    pending.remove(sock)
+                    result = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    if result:
+                        error = self.connect_failed(sock, sockaddr, result)
+                        next_attempt = 0  # Don't wait to try the next address
+                        continue
+                    sock.setblocking(True)
+                    sock.settimeout(timeout)
+                    return sock
+            raise error
+        finally:
+            for sock in pending:
+                sock.close()
+            selector.close()
+            
+    async def happy_eyeballs_async(self, addresses, socket_options):
+        """happy_eyeballs() with loop.sock_connect, the attempts run on the event loop"""
+        loop = asyncio.get_running_loop()
+        attempts = {}  # connect task -> (sock, sockaddr)
+        error = OSError("No addresses to connect to")
+        try:
+            while addresses or attempts:
+                if addresses:
+                    family, sockaddr = addresses.pop(0)
+                    sock = socket.socket(family, socket.SOCK_STREAM)
+                    for option in socket_options or []:
+                        sock.setsockopt(*option)
+                    sock.setblocking(False)
+                    attempts[asyncio.ensure_future(loop.sock_connect(sock, sockaddr))] = (sock, sockaddr)
+                # The next address gets its turn after the delay or as soon as an attempt fails
+                done, _ = await asyncio.wait(attempts, timeout=HAPPY_EYEBALLS_DELAY if addresses else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    sock, sockaddr = attempts.pop(task)
+                    if task.exception() is None:
+                        return sock
+                    error = self.connect_failed(sock, sockaddr, getattr(task.exception(), "errno", None) or errno.EIO)
+            raise error
+        finally:
+            for task, (sock, sockaddr) in attempts.items():
+                task.cancel()
+                sock.close()
+            
+    def connect_failed(self, sock, sockaddr, result):
+        sock.close()
+        with self.lock:
+            self.failures[sockaddr[0]] = time.time()
+        logger.debug(f"Connect to {sockaddr[0]} failed: {os.strerror(result)}")
+        return OSError(result, f"{os.strerror(result)} ({sockaddr[0]})")
+        
+    def get_stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "hosts": len(self.entries)}
+
+
+class ResolvingAdapter(requests.adapters.HTTPAdapter):
+    """HTTPAdapter that opens its connections through a Resolver, pinned to one address of host if given.
+    
+    host_slots(scheme, host, port) returns a semaphore shared by every
+    adapter talking to that host. A connection holds one of its slots
+    while it is checked out, so sessions pinned to different addresses
+    share the per-host cap.
+    """
+    def __init__(self, resolver, host=None, address=None, host_slots=None, **kwargs):
+        self.resolver = resolver
+        self.host = host
+        self.address = address
+        self.host_slots = host_slots
+        super().__init__(**kwargs)
+        
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": self.pool_class(urllib3.HTTPConnectionPool, urllib3.connection.HTTPConnection),
+            "https": self.pool_class(urllib3.HTTPSConnectionPool, urllib3.connection.HTTPSConnection)
+        }
+        
+    def pool_class(self, base, connection_base):
+        adapter = self
+        
+        class ResolvingPool(base):
+            ConnectionCls = adapter.connection_class(connection_base)
+            
+            def _get_conn(self, timeout=None):
+                slots = adapter.host_slots(self.scheme, self.host, self.port) if adapter.host_slots else None
+                if slots and not slots.acquire(timeout=timeout):
+                    raise urllib3.exceptions.EmptyPoolError(self, "No free connection slot for the host")
+                try:
+                    return super()._get_conn(timeout)
+                except BaseException:
+                    if slots:
+                        slots.release()
+                    raise
+                    
+            def _put_conn(self, conn):
+                try:
+                    super()._put_conn(conn)
+                finally:
+                    if adapter.host_slots:
+                        adapter.host_slots(self.scheme, self.host, self.port).release()
+                        
+        return ResolvingPool
+        
+    def connection_class(self, base):
+        adapter = self
+        
+        class ResolvingConnection(base):
+            def _new_conn(self):
+                # Redirects to another host don't use the pinned address
+                address = adapter.address if self._dns_host == adapter.host else None
+                timeout = self.timeout if isinstance(self.timeout, (int, float)) else None
+                try:
+                    return adapter.resolver.connect(self._dns_host, self.port, timeout, address, self.socket_options)
+                except socket.gaierror as e:
+                    raise urllib3.exceptions.NameResolutionError(self.host, self, e) from e
+                except socket.timeout as e:
+                    raise urllib3.exceptions.ConnectTimeoutError(
+                        self, f"Connection to {self.host} timed out. (connect timeout={timeout})") from e
+                except OSError as e:
+                    raise urllib3.exceptions.NewConnectionError(
+                        self, f"Failed to establish a new connection: {e}") from e
+                        
+        return ResolvingConnection
+
+
+class ConnectionPool:
+    """Keep-alive HTTP sessions shared by every request to the same host, or host address"""
+    def __init__(self, max_per_host=MAX_CONNECTIONS, idle_timeout=POOL_IDLE_TIMEOUT, resolver=None):
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.resolver = resolver or Resolver()
+        self.hosts = {}  # (scheme, host, port, address) -> {"session", "active", "last_used"}
+        self.slots = {}  # (scheme, host, port) -> semaphore of max_per_host, shared by its address sessions
+        self.lock = threading.Lock()
+        # Counters of sessions that were already closed
+        self.closed_hits = 0
+        self.closed_misses = 0
+        
+    def host_key(self, url, address=None):
+        parsed = urlparse(url)
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        return parsed.scheme, parsed.hostname, port, address
+        
+    def acquire(self, url, address=None):
+        """Return the session for the URL's host, call release() when done with it.
+        
+        With an address the session connects to that address of the host.
+        """
+        key = self.host_key(url, address)
+        with self.lock:
+            self.evict_idle()
+            host = self.hosts.get(key)
+            if host is None:
+                session = requests.Session()
+                # Block instead of opening more than max_per_host connections;
+                # a few pools per session so redirects don't push out the origin
+                adapter = ResolvingAdapter(self.resolver, key[1], address, self.host_slots, pool_connections=4,
+                                           pool_maxsize=self.max_per_host, pool_block=True)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                host = self.hosts[key] = {"session": session, "active": 0, "last_used": 0}
+                logger.debug(f"Opened session for {key[1]}:{key[2]}")
+            host["active"] += 1
+            host["last_used"] = time.time()
+            return host["session"]
+            
+    def host_slots(self, scheme, host, port):
+        """Semaphore counting the connections checked out to a host, over all of its addresses"""
+        with self.lock:
+            if (scheme, host, port) not in self.slots:
+                self.slots[scheme, host, port] = threading.Semaphore(self.max_per_host)
+            return self.slots[scheme, host, port]
+            
+    def release(self, url, address=None):
+        with self.lock:
+            host = self.hosts.get(self.host_key(url, address))
+            if host:
+                host["active"] = max(0, host["active"] - 1)
+                host["last_used"] = time.time()
+                
+    def evict_idle(self):
+        """Close sessions nobody used for idle_timeout seconds, caller holds the lock"""
+        now = time.time()
+        for key, host in list(self.hosts.items()):
+            if host["active"] == 0 and now - host["last_used"] >= self.idle_timeout:
+                self.close_session(key)
+                
+    def close_session(self, key):
+        host = self.hosts.pop(key)
+        hits, misses = self.count_connections(host["session"])
+        self.closed_hits += hits
+        self.closed_misses += misses
+        host["session"].close()
+        logger.debug(f"Closed idle session for {key[1]}:{key[2]}")
+        
+    def count_connections(self, session):
+        """Return (hits, misses): requests on a reused connection and new connections"""
+        hits = misses = 0
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for pool_key in pools.keys():
+                pool = pools.get(pool_key)
+                if pool is not None:
+                    misses += pool.num_connections
+                    hits += pool.num_requests - pool.num_connections
+        return hits, misses
+        
+    def get_stats(self):
+        with self.lock:
+            self.evict_idle()
+            hits, misses = self.closed_hits, self.closed_misses
+            for host in self.hosts.values():
+                host_hits, host_misses = self.count_connections(host["session"])
+                hits += host_hits
+                misses += host_misses
+            return {"hits": hits, "misses": misses, "hosts": len(self.hosts)}
+            
+    def close(self):
+        with self.lock:
+            for key in list(self.hosts):
+                self.close_session(key)
+
+
+class ProbeCache:
+    """Probe results by URL, shared by every download until they expire"""
+    def __init__(self, ttl=PROBE_CACHE_TTL):
+        self.ttl = ttl
+        self.entries = {}  # url -> (expires, info)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        
+    def get(self, url):
+        """A copy of the cached probe result for url, None if there is no fresh one"""
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry and entry[0] > time.time():
+                self.hits += 1
+                return dict(entry[1])
+            self.entries.pop(url, None)
+            self.misses += 1
+            return None
+            
+    def put(self, url, info):
+        with self.lock:
+            self.entries[url] = (time.time() + self.ttl, dict(info))
+            
+    def invalidate(self, url):
+        with self.lock:
+            self.entries.pop(url, None)
+            
+    def get_stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries)}
+
+
+class HTTPStatusError(Exception):
+    """Error status returned by a server to the asyncio engine"""
+    def __init__(self, status, retry_after=None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+class RemoteFileChanged(Exception):
+    """A validated range request got the whole file back, so the .part data is stale"""
+    def __init__(self, etag=None, last_modified=None):
+        super().__init__(f"File changed on the server (ETag {etag}, Last-Modified {last_modified})")
+        self.etag = etag
+        self.last_modified = last_modified
+
+
+def parse_checksum(text):
+    """Normalise "algorithm:hexdigest" or a bare hex digest, raises ValueError if it is neither"""
+    text = text.strip().lower()
+    algorithm, _, digest = text.rpartition(":")
+    if not algorithm:
+        # Bare digest, the length tells the algorithm apart
+        algorithm = next((name for name, length in CHECKSUM_ALGORITHMS.items() if length == len(digest)), "")
+    if CHECKSUM_ALGORITHMS.get(algorithm) != len(digest) or any(c not in "0123456789abcdef" for c in digest):
+        raise ValueError(f"Invalid checksum: {text}")
+    return f"{algorithm}:{digest}"
+
+
+def archive_type(file_name):
+    """(kind, suffix) of an archive the extraction stage can unpack, None for other files"""
+    for suffix, kind in ARCHIVE_TYPES:
+        if file_name.lower().endswith(suffix):
+            return kind, suffix
+    return None
+
+
+def reserve_space(fd, size):
+    """Allocate the first size bytes of fd without writing them, returns False if the filesystem can't"""
+    if libc_fallocate is not None:
+        if libc_fallocate(fd, 0, 0, size) == 0:
+            return True
+        error = ctypes.get_errno()
+        if error == errno.ENOSPC:
+            raise OSError(error, os.strerror(error))
+        return False
+    if not hasattr(os, "posix_fallocate") or sys.platform.startswith("linux"):
+        return False
+    try:
+        os.posix_fallocate(fd, 0, size)
+        return True
+    except OSError as e:
+        if e.errno == errno.ENOSPC:
+            raise
+        return False
+
+
+def is_transient_error(error):
+    """Whether a failed transfer is worth retrying from its current offset"""
+    status = None
+    if isinstance(error, HTTPStatusError):
+        status = error.status
+    elif isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        status = error.response.status_code
+    if status is not None:
+        return status >= 500 or status in RETRY_STATUS_CODES
+    return isinstance(error, (
+        requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+        requests.exceptions.ChunkedEncodingError, asyncio.IncompleteReadError,
+        asyncio.TimeoutError, TimeoutError, ConnectionError, http.client.IncompleteRead
+    ))
+
+
+class BufferPool:
+    """Reusable receive buffers in power-of-two size classes.
+    
+    A transfer reads straight into a buffer from the pool, the buffer
+    travels to the PartFile writer as a memoryview and comes back once it
+    is on disk, so steady-state downloading allocates no chunk memory.
+    """
+    def __init__(self, max_free_bytes=BUFFER_POOL_SIZE):
+        self.lock = threading.Lock()
+        self.max_free_bytes = max_free_bytes
+        self.free = {}  # capacity -> [bytearray]
+        self.free_bytes = 0
+        self.allocated = 0
+        self.reused = 0
+        
+    def acquire(self, size):
+        capacity = max(4096, 1 << (size - 1).bit_length())
+        with self.lock:
+            buffers = self.free.get(capacity)
+            if buffers:
+                self.free_bytes -= capacity
+                self.reused += 1
+                return buffers.pop()
+            self.allocated += 1
+        return bytearray(capacity)
+        
+    def release(self, buffer):
+        with self.lock:
+            if self.free_bytes + len(buffer) <= self.max_free_bytes:
+                self.free.setdefault(len(buffer), []).append(buffer)
+                self.free_bytes += len(buffer)
+                
+    def get_stats(self):
+        with self.lock:
+            return {"allocated": self.allocated, "reused": self.reused, "free_bytes": self.free_bytes}
+
+
+class PartFile:
+    """The .part file of a download, shared by all of its transfers.
+    
+    Transfers hand their chunks to a bounded write-behind buffer and one
+    of the WRITER_THREADS shared by all files coalesces neighbouring chunks
+    into large os.pwrite calls, so slow storage does not stall network
+    reads until the buffer is full.
+    The file descriptor is open while at least one transfer is inside a
+    `with part_file` block.
+    
+    fsync_policy decides when written data counts as durable: "never" (once
+    the OS has it), "size" (every fsync_interval bytes) or "checkpoint" (on
+    every progress checkpoint). A transfer's durable_offset only moves past
+    durable data and is what resume offsets are built from.
+    """
+    writers = concurrent.futures.ThreadPoolExecutor(WRITER_THREADS, thread_name_prefix="part-writer")
+    
+    def __init__(self, path, buffer_size=WRITE_BUFFER_SIZE, fsync_policy="checkpoint", fsync_interval=FSYNC_INTERVAL,
+                 buffer_pool=None):
+        self.path = path
+        self.size = 0  # Full file size, preallocated when the file opens, 0 if unknown
+        self.buffer_pool = buffer_pool  # Pooled buffers go back here once written
+        self.buffer_size = buffer_size
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)
+        self.fd = None
+        self.users = 0
+        self.writer = None  # Future of the writer task while one drains pending
+        self.pending = []  # (offset, data, transfer, queued_at) waiting for the writer
+        self.buffered = 0  # Bytes handed in and not written yet
+        self.written = {}  # transfer -> end offset written but not durable yet
+        self.unsynced = 0  # Bytes written since the last fsync
+        self.error = None  # OSError from the writer, raised to the transfers
+        self.write_latency = 0  # Moving average of seconds from write() to disk
+        self.fsyncs = 0
+        self.watchers = []  # WrittenPrefix objects told about every write
+        
+    def __enter__(self):
+        with self.lock:
+            if self.fd is None:
+                self.error = None  # A failed write is retried once the file is opened again
+                self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+                try:
+                    self.allocate()
+                except OSError:
+                    os.close(self.fd)
+                    self.fd = None
+                    raise
+                self.open_storage()
+            self.users += 1
+        return self
+        
+    def __exit__(self, *exc_info):
+        with self.cond:
+            self.users -= 1
+            if self.users > 0:
+                return
+            # Last user, everything buffered goes to disk before the file closes,
+            # and after an error the writer still has to be done with the descriptor
+            while self.writer is not None:
+                self.cond.wait()
+            if self.users > 0 or self.fd is None:
+                return
+            marks, self.written = self.written, {}
+            try:
+                if marks and self.fsync_policy != "never":
+                    self.sync_to_disk()
+                for transfer, offset in marks.items():
+                    transfer.durable_offset = max(transfer.durable_offset, offset)
+            finally:
+                self.close_storage()
+                os.close(self.fd)
+                self.fd = None
+                self.cond.notify_all()
+            
+    def allocate(self):
+        """Bring the file to its full size as it opens, raises OSError when the disk is full"""
+        if self.size <= 0:
+            return
+        current = os.fstat(self.fd).st_size
+        if current > self.size:
+            # Left over from a larger version of the file
+            os.ftruncate(self.fd, self.size)
+        elif current < self.size:
+            if reserve_space(self.fd, self.size):
+                logger.info(f"Preallocated {self.size} bytes for {self.path}")
+            else:
+                # No fallocate on this platform or filesystem, use a sparse file
+                os.ftruncate(self.fd, self.size)
+                logger.info(f"Created sparse file of {self.size} bytes for {self.path}")
+                
+    def has_room(self, size):
+        return self.buffered == 0 or self.buffered + size <= self.buffer_size
+        
+    def wait_for_room(self, size):
+        with self.cond:
+            while not self.has_room(size) and not self.error:
+                self.cond.wait()
+                
+    def write(self, data, offset, transfer):
+        """Queue data for offset, blocks while the buffer is full"""
+        with self.cond:
+            while not self.has_room(len(data)) and not self.error:
+                self.cond.wait()
+            if self.error:
+                raise self.error
+            self.pending.append((offset, data, transfer, time.monotonic()))
+            self.buffered += len(data)
+            if self.writer is None:
+                self.writer = self.writers.submit(self.run_writer)
+            self.cond.notify_all()
+            
+    def commit(self):
+        """Wait until everything queued is written and durable"""
+        with self.cond:
+            while self.buffered and not self.error:
+                self.cond.wait()
+            if self.error:
+                raise self.error
+        self.make_durable()
+        
+    def checkpoint(self):
+        """Make written data durable if the policy syncs on checkpoints"""
+        if self.fsync_policy != "checkpoint":
+            return
+        with self.lock:
+            if self.fd is None or not self.written:
+                return
+            self.users += 1  # Keep the file open while syncing
+        try:
+            self.make_durable()
+        finally:
+            self.__exit__()
+            
+    def make_durable(self):
+        with self.lock:
+            marks, self.written = self.written, {}
+            self.unsynced = 0
+        if marks and self.fsync_policy != "never":
+            self.sync_to_disk()
+        for transfer, offset in marks.items():
+            transfer.durable_offset = max(transfer.durable_offset, offset)
+            
+    def open_storage(self):
+        """Called with the lock held once the file is open"""
+        
+    def close_storage(self):
+        """Called with the lock held before the file closes"""
+        
+    def sync_to_disk(self):
+        os.fsync(self.fd)
+        self.fsyncs += 1
+            
+    def run_writer(self):
+        """Write what is pending until nothing is left, runs on one of the shared writer threads"""
+        while True:
+            with self.cond:
+                if not self.pending:
+                    self.writer = None
+                    self.cond.notify_all()
+                    return
+                batch, self.pending = sorted(self.pending, key=lambda item: item[0]), []
+                failed = self.error is not None
+                
+            size = sum(len(data) for offset, data, transfer, queued_at in batch)
+            try:
+                # After an error the rest is dropped, transfers restart from their durable offset
+                if not failed:
+                    self.write_batch(batch)
+                    with self.lock:
+                        for offset, data, transfer, queued_at in batch:
+                            self.written[transfer] = max(self.written.get(transfer, 0), offset + len(data))
+                        self.unsynced += size
+                        sync_due = self.fsync_policy == "never" or (
+                            self.fsync_policy == "size" and self.unsynced >= self.fsync_interval)
+                    # The file cannot close before the writer is done, so syncing here is safe
+                    if sync_due:
+                        self.make_durable()
+            except OSError as e:
+                logger.error(f"Error writing {self.path}: {str(e)}")
+                self.error = e
+            if self.buffer_pool:
+                for offset, data, transfer, queued_at in batch:
+                    if isinstance(data, memoryview):
+                        self.buffer_pool.release(data.obj)
+                
+            with self.cond:
+                latency = time.monotonic() - min(queued_at for offset, data, transfer, queued_at in batch)
+                self.write_latency = latency if not self.write_latency else 0.8 * self.write_latency + 0.2 * latency
+                self.buffered -= size
+                self.cond.notify_all()
+                
+    def write_batch(self, batch):
+        """Write sorted chunks, one os.pwritev per run of adjacent chunks"""
+        runs = []  # [offset, buffers, length]
+        for offset, data, transfer, queued_at in batch:
+            if runs and runs[-1][0] + runs[-1][2] == offset:
+                runs[-1][1].append(data)
+                runs[-1][2] += len(data)
+            else:
+                runs.append([offset, [data], len(data)])
+        for offset, buffers, length in runs:
+            self.pwritev(buffers, offset)
+            for watcher in self.watchers:
+                watcher.update(offset, buffers)
+            
+    def pwritev(self, buffers, offset):
+        """Write buffers back to back from offset without joining them"""
+        if not hasattr(os, "pwritev"):
+            for data in buffers:
+                self.pwrite(data, offset)
+                offset += len(data)
+            return
+        views = [memoryview(data) for data in buffers]
+        first = 0
+        while first < len(views):
+            written = os.pwritev(self.fd, views[first:first + IOV_MAX], offset)
+            offset += written
+            # The kernel may stop part way through a buffer
+            while written and first < len(views):
+                if written >= len(views[first]):
+                    written -= len(views[first])
+                    first += 1
+                else:
+                    views[first] = views[first][written:]
+                    written = 0
+                    
+
+    def pwrite(self, data, offset):
+        view = memoryview(data)
+        if hasattr(os, "pwrite"):
+            while view:
+                written = os.pwrite(self.fd, view, offset)
+                view = view[written:]
+                offset += written
+        else:
+            # Windows has no positional write, only the file's writer task seeks
+            os.lseek(self.fd, offset, os.SEEK_SET)
+            while view:
+                view = view[os.write(self.fd, view):]
+                
+    def get_stats(self):
+        return {
+            "buffered": self.buffered,
+            "buffer_size": self.buffer_size,
+            "write_latency": self.write_latency,
+            "fsyncs": self.fsyncs
+        }
+
+
+class MappedPartFile(PartFile):
+    """PartFile backend that maps the preallocated file into memory.
+    
+    The writer tasks copy each batch into the mapping instead of calling
+    os.pwritev, so there are no write syscalls, and msync makes the pages
+    durable following the same fsync_policy. Like the file backend's
+    writes, copies and msync run on the writer threads and never on the
+    event loop. Files of unknown size are not mapped and are written as usual.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.map = None
+        
+    def open_storage(self):
+        size = os.fstat(self.fd).st_size
+        if size > 0:
+            self.map = mmap.mmap(self.fd, size)
+            
+    def close_storage(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+            
+    def sync_to_disk(self):
+        if self.map is not None:
+            self.map.flush()
+            self.fsyncs += 1
+        else:
+            super().sync_to_disk()
+            
+    def pwritev(self, buffers, offset):
+        if self.map is None or offset + sum(len(data) for data in buffers) > len(self.map):
+            return super().pwritev(buffers, offset)
+        for data in buffers:
+            self.map[offset:offset + len(data)] = data
+            offset += len(data)
+
+
+
+class WrittenPrefix:
+    """Length of the part of a .part file that is written contiguously from its start.
+    
+    Segments land out of order, so writes past the prefix are remembered
+    as ranges until the prefix grows into them. A PartFile calls update()
+    on each of its watchers after every write.
+    """
+    def __init__(self):
+        self.position = 0  # End of the contiguous prefix
+        self.ahead = []  # [start, end) ranges written past position
+        self.reading_back = False  # While set, writes at position are kept as ranges too
+        self.lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)
+        
+    def update(self, offset, buffers):
+        """Called once buffers are written back to back from offset"""
+        with self.lock:
+            for data in buffers:
+                view = memoryview(data)
+                end = offset + len(view)
+                if offset <= self.position < end and not self.reading_back:
+                    self.consume(view[self.position - offset:])
+                    self.position = end
+                elif end > self.position:
+                    self.add_range(offset, end)
+                offset = end
+            self.catch_up()
+            self.cond.notify_all()
+            
+    def consume(self, data):
+        """Called in file order with the written bytes the prefix grows by"""
+        
+    def add_range(self, start, end):
+        for written in self.ahead:
+            if start <= written[1] and end >= written[0]:
+                written[0], written[1] = min(start, written[0]), max(end, written[1])
+                return
+        self.ahead.append([start, end])
+        
+    def seed(self, end):
+        """Count the first end bytes as written, such as those from an earlier session"""
+        with self.lock:
+            if end > self.position:
+                self.add_range(0, end)
+                self.catch_up()
+                self.cond.notify_all()
+                
+    def take_reached(self):
+        """Remove the ranges written ahead that the prefix has reached, returns where they end or None"""
+        reached = [written for written in self.ahead if written[0] <= self.position]
+        for written in reached:
+            self.ahead.remove(written)
+        return max(written[1] for written in reached) if reached else None
+        
+    def catch_up(self):
+        """Grow the prefix over the ranges written ahead that it has reached, caller holds the lock"""
+        while True:
+            end = self.take_reached()
+            if end is None:
+                return
+            self.position = max(self.position, end)
+            
+    def wait(self, position, timeout=None):
+        """Wait until the prefix grows past position or timeout runs out, returns its length"""
+        with self.cond:
+            if self.position <= position:
+                self.cond.wait(timeout)
+            return self.position
+            
+    def wake(self):
+        with self.cond:
+            self.cond.notify_all()
+
+
+class StreamingHash(WrittenPrefix):
+    """Checksum of a .part file computed while it is being written.
+    
+    Hashes need the bytes in file order. Writes that land at the hashed
+    position are hashed from memory as they go to disk. Ranges written
+    further ahead are read back (usually from the page cache) by a hasher
+    thread of their own once the hashed position reaches them, so the
+    shared writer threads never stall on it. finish() hashes whatever is
+    left, such as bytes written before a restart.
+    """
+    def __init__(self, algorithm, path):
+        super().__init__()
+        self.algorithm = algorithm
+        self.path = path
+        self.hash = hashlib.new(algorithm)
+        self.hasher = None  # Thread reading back reached ranges while it runs
+        
+    def consume(self, data):
+        self.hash.update(data)
+        
+    def catch_up(self):
+        if self.hasher is None and any(written[0] <= self.position for written in self.ahead):
+            self.hasher = threading.Thread(target=self.run_hasher, daemon=True)
+            self.hasher.start()
+            
+    def run_hasher(self):
+        try:
+            with open(self.path, "rb", buffering=0) as f:
+                while True:
+                    with self.lock:
+                        end = self.take_reached()
+                        if end is None:
+                            self.hasher = None
+                            self.cond.notify_all()
+                            return
+                        # Only this thread moves the position until it is cleared
+                        self.reading_back = True
+                    f.seek(self.position)
+                    while self.position < end:
+                        data = f.read(min(HASH_READ_SIZE, end - self.position))
+                        if not data:
+                            raise OSError(f"Unexpected end of file while hashing at {self.position}")
+                        self.hash.update(data)
+                        with self.lock:
+                            self.position += len(data)
+                    with self.lock:
+                        self.reading_back = False
+        except OSError as e:
+            # finish() reads on from the position
+            logger.error(f"Error hashing {self.path}: {str(e)}")
+            with self.lock:
+                self.reading_back = False
+                self.hasher = None
+                self.cond.notify_all()
+                
+    def finish(self, path):
+        """Hash the rest of the file at path, returns the hex digest"""
+        with self.lock:
+            while self.hasher is not None:
+                self.cond.wait()
+            with open(path, "rb") as f:
+                f.seek(self.position)
+                while True:
+                    data = f.read(HASH_READ_SIZE)
+                    if not data:
+                        break
+                    self.hash.update(data)
+                    self.position += len(data)
+            self.ahead = []
+            return self.hash.hexdigest()
+
+
+class GrowingFileReader:
+    """Read-only file object over a .part file that is still being written.
+    
+    Reads only return bytes inside the written prefix and block until more
+    arrive, so stream decoders can consume a download as it happens. Once
+    complete is set reads go on to the end of the file.
+    """
+    def __init__(self, path, prefix, stop_event):
+        self.path = path
+        self.prefix = prefix
+        self.stop_event = stop_event
+        self.complete = False
+        self.offset = 0
+        self.file = None
+        self.lock = threading.Lock()  # Held while reading so the file can move between reads
+        
+    def read(self, size=-1):
+        while not self.complete and self.prefix.position <= self.offset:
+            if self.stop_event.is_set():
+                raise InterruptedError("Extraction stopped")
+            self.prefix.wait(self.offset, 1.0)
+        if self.stop_event.is_set():
+            raise InterruptedError("Extraction stopped")
+            
+        with self.lock:
+            if self.file is None:
+                # Unbuffered, read-ahead would keep bytes of the preallocated file that are not written yet
+                self.file = open(self.path, "rb", buffering=0)
+                self.file.seek(self.offset)
+            if not self.complete:
+                available = self.prefix.position - self.offset
+                size = available if size < 0 else min(size, available)
+            data = self.file.read(size)
+        self.offset += len(data)
+        return data
+        
+    def wait_complete(self):
+        while not self.complete:
+            if self.stop_event.is_set():
+                raise InterruptedError("Extraction stopped")
+            self.prefix.wait(self.prefix.position, 1.0)
+            
+    def close(self):
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+
+class Extractor(threading.Thread):
+    """Unpacks a downloaded archive on its own thread as the download arrives.
+    
+    Tar archives, plain or gz, bz2, xz or zstd compressed, are decoded in
+    stream mode straight from the .part file while the written prefix
+    grows, so they are unpacked shortly after the last byte arrives
+    instead of being read back afterwards. Zip keeps its index at the end
+    and is unpacked once the download is complete.
+    """
+    def __init__(self, path, size, destination, kind, prefix, complete=False):
+        super().__init__(daemon=True)
+        self.size = size
+        self.destination = destination
+        self.kind = kind
+        self._stop_event = threading.Event()
+        self.reader = GrowingFileReader(path, prefix, self._stop_event)
+        self.reader.complete = complete
+        self.status = "waiting"  # waiting, extracting, done, error or stopped
+        self.files = 0
+        self.total_files = 0  # Only known for zip
+        self.error = None
+        
+    def run(self):
+        try:
+            os.makedirs(self.destination, exist_ok=True)
+            if self.kind == "zip":
+                self.extract_zip()
+            else:
+                self.extract_tar()
+            self.status = "done"
+            logger.info(f"Extracted {self.files} files to {self.destination}")
+        except InterruptedError:
+            self.status = "stopped"
+        except Exception as e:
+            self.status = "error"
+            self.error = str(e)
+            logger.error(f"Error extracting {self.reader.path}: {str(e)}")
+        finally:
+            self.reader.close()
+            
+    def extract_tar(self):
+        source, mode = self.reader, self.kind
+        if self.kind == "zst":
+            source, mode = zstandard.ZstdDecompressor().stream_reader(self.reader), "r|"
+        with tarfile.open(fileobj=source, mode=mode) as archive:
+            if hasattr(tarfile, "data_filter"):
+                # No absolute paths, links out of the destination or device files
+                archive.extraction_filter = tarfile.data_filter
+            self.status = "extracting"
+            for member in archive:
+                archive.extract(member, self.destination)
+                self.files += 1
+                
+    def extract_zip(self):
+        self.reader.wait_complete()
+        with zipfile.ZipFile(self.reader.path) as archive:
+            self.status = "extracting"
+            members = archive.infolist()
+            self.total_files = len(members)
+            for member in members:
+                if self._stop_event.is_set():
+                    raise InterruptedError("Extraction stopped")
+                archive.extract(member, self.destination)
+                self.files += 1
+                
+    def source_moved(self, path, move):
+        """The download completed, move() renames its .part file to path"""
+        with self.reader.lock:
+            if self.reader.file:
+                self.reader.file.close()
+                self.reader.file = None
+            try:
+                move()
+                self.reader.path = path
+            finally:
+                self.reader.complete = True
+        self.reader.prefix.wake()
+        
+    def stop(self):
+        self._stop_event.set()
+        self.reader.prefix.wake()
+        
+    def get_stats(self):
+        if self.kind == "zip":
+            progress = self.files / self.total_files if self.total_files else 0
+        else:
+            progress = self.reader.offset / self.size if self.size else 0
+        return {"status": self.status, "files": self.files, "progress": min(progress, 1.0), "error": self.error}
+
+
+class RateLimiter:
+    """Token bucket shared by every transfer it throttles, a rate of 0 means unlimited.
+    
+    The bucket only holds RATE_LIMIT_BURST seconds worth of bytes and a
+    read that overdraws it waits for the debt to be paid back, so a capped
+    transfer is paced evenly instead of alternating bursts and stalls.
+    """
+    def __init__(self, rate=0, burst=RATE_LIMIT_BURST):
+        self.lock = threading.Lock()
+        self.rate = rate  # Bytes per second
+        self.burst = burst
+        self.tokens = 0
+        self.last_refill = time.monotonic()
+        
+    def set_rate(self, rate):
+        with self.lock:
+            self.rate = rate
+            self.tokens = min(self.tokens, rate * self.burst)
+            
+    def reserve(self, amount):
+        """Take amount bytes from the bucket and return how long the caller has to wait"""
+        with self.lock:
+            if self.rate <= 0:
+                return 0
+            now = time.monotonic()
+            self.tokens = min(self.rate * self.burst, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            self.tokens -= amount
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+            
+    def max_chunk(self):
+        """Largest read that keeps pacing smooth, None when unlimited"""
+        return max(1024, int(self.rate * self.burst)) if self.rate > 0 else None
+
+
+class ConnectionTuner:
+    """AIMD choice of how many connections one download uses.
+    
+    Every AUTO_TUNE_INTERVAL seconds the download's throughput is compared
+    with the step before. One connection is added while that keeps gaining
+    AUTO_TUNE_GAIN or more, a connection that brought less is taken back,
+    and the count is halved as soon as transfers had to retry (429, 503,
+    resets and timeouts), which is how servers push back.
+    """
+    def __init__(self, start, downloaded=0, retries=0):
+        self.target = start
+        self.rate_before = 0  # Throughput before the last connection was added
+        self.added = False  # Whether the last step added a connection
+        self.hold_until = 0
+        self.last_time = time.time()
+        self.last_downloaded = downloaded
+        self.last_retries = retries
+        self.history = [(self.last_time, start, 0, "start")]  # (time, connections, bytes per second, reason)
+        
+    def update(self, downloaded, retries, limit):
+        """Feed the download's progress and total retries, returns the connection count to use.
+        
+        limit is how many connections the global and per-host caps leave
+        for this download right now.
+        """
+        now = time.time()
+        elapsed = now - self.last_time
+        if elapsed < AUTO_TUNE_INTERVAL:
+            return min(self.target, limit)
+        rate = (downloaded - self.last_downloaded) / elapsed
+        backed_off = retries > self.last_retries
+        self.last_time, self.last_downloaded, self.last_retries = now, downloaded, retries
+        if elapsed > 3 * AUTO_TUNE_INTERVAL:
+            return min(self.target, limit)  # Paused in between, the sample means nothing
+            
+        if backed_off:
+            self.change(max(1, self.target // 2), rate, "backoff")
+            self.hold_until = now + AUTO_TUNE_HOLD
+        elif self.added and rate < self.rate_before * (1 + AUTO_TUNE_GAIN):
+            self.change(max(1, self.target - 1), rate, "no gain")
+            self.hold_until = now + AUTO_TUNE_HOLD
+        elif now >= self.hold_until and self.target < limit:
+            self.rate_before = rate
+            self.change(self.target + 1, rate, "faster" if self.added else "probe")
+            self.added = True
+            return self.target
+        if self.target > limit:
+            self.change(limit, rate, "cap")
+        self.added = False
+        return self.target
+        
+    def change(self, target, rate, reason):
+        self.target = target
+        self.history.append((time.time(), target, rate, reason))
+        del self.history[:-AUTO_TUNE_HISTORY]
 
 
 class DownloadThread(threading.Thread):
     def __init__(self, url, file_path, start_byte, end_byte, progress_callback, 
-                 complete_callback, error_callback, headers=None, timeout=30, db_id=None, db_manager=None, chunk_size_setting=DEFAULT_CHUNK_SIZE):
+                 complete_callback, error_callback, headers=None, timeout=30, db_id=None, db_manager=None, chunk_size_setting=DEFAULT_CHUNK_SIZE,
+                 next_range_callback=None, pool=None, rate_limiters=None, pause_grace=PAUSE_GRACE_PERIOD,
+                 part_file=None, buffer_pool=None, changed_callback=None, response_callback=None):
         super().__init__()
         self.url = url
         self.file_path = file_path
@@ -245,6 +1831,9 @@ class DownloadThread(threading.Thread):
         self.timeout = timeout
         self._stop_event = threading.Event()
         self._pause_event = threading.Event()
+        self._resume_event = threading.Event()  # Set while not paused, paused transfers block on it
+        self._resume_event.set()
+        self.pause_grace = pause_grace
         self.downloaded = 0  # Bytes downloaded in this session
         self.speed = 0
         self.last_update_time = time.time()
@@ -253,95 +1842,233 @@ class DownloadThread(threading.Thread):
         self.db_id = db_id
         self.db_manager = db_manager
         self.speed_samples = []  # For calculating average speed
-        self.retry_count = 0
-        self.max_retries = 5
+        self.retry_count = 0  # Retries over the whole transfer
+        self.retry_attempt = 0  # Consecutive failures without progress
+        self.failed_position = -1
+        self.refetched_bytes = 0  # Bytes downloaded again because a retry rewound
+        self.max_retries = MAX_RETRIES
         self.chunk_size_setting = chunk_size_setting
+        self.completed = False
+        self.next_range_callback = next_range_callback
+        self.pool = pool
+        self.rate_limiters = rate_limiters or []  # Global and per-download RateLimiters
+        self.part_file = part_file or PartFile(file_path)
+        self.durable_offset = start_byte  # Everything before this is safely on disk
+        self.buffer_pool = buffer_pool  # Receive with readinto when set
+        self.changed_callback = changed_callback  # Called instead of error_callback when the file changed
+        self.response_callback = response_callback  # Returns a response already open at a position, or None
+        self.address = None  # Address of the host to connect to, set by the manager for segments
+        self.session_address = None  # Address of the session held right now
+        self.range_started = None  # When work on the current range began
+        self.last_received = 0  # When data last arrived, or the transfer was resumed
+        self.session_url = None  # URL the session held right now was acquired for
+        self.auto_read_size = DEFAULT_CHUNK_SIZE  # Current read size of the AUTO chunk size
+        self.range_lock = threading.Lock()
         logger.info(f"Download thread created for {url} with chunk size setting: {chunk_size_setting}")
         
     def run(self):
+        self.range_started = time.time()
+        session = self.acquire_session()
         try:
-            # Add range header for partial download
-            range_header = f'bytes={self.start_byte + self.downloaded}-{self.end_byte}'
-            self.headers['Range'] = range_header
+            while True:
+                try:
+                    released = self.download_range(session)
+                except Exception as e:
+                    if not is_transient_error(e):
+                        raise
+                    if not self.next_retry():
+                        raise Exception(f"Failed after {self.max_retries} retries: {str(e)}")
+                    delay = self.retry_delay(e)
+                    logger.warning(f"{type(e).__name__} at byte {self.start_byte + self.downloaded}, "
+                                   f"retrying {self.retry_attempt}/{self.max_retries} in {delay:.1f}s: {str(e)}")
+                    if self._stop_event.wait(delay):
+                        return
+                    self.rewind_to_persisted()
+                    continue
+                    
+                if self._stop_event.is_set():
+                    return
+                if released:
+                    # Paused past the grace period, hold no socket until resumed
+                    self.release_session(session)
+                    session = None
+                    self._resume_event.wait()
+                    if self._stop_event.is_set():
+                        return
+                    session = self.acquire_session()
+                    continue
+                # Ask for more work before finishing so the connection stays busy
+                if not (self.next_range_callback and self.next_range_callback(self)):
+                    break
+                if self.address != self.session_address or self.url != self.session_url:
+                    # Moved to another address or mirror along with the new range
+                    self.release_session(session)
+                    session = self.acquire_session()
+            
+            self.completed = True
+            self.complete_callback(self.average_speed())
+                
+        except RemoteFileChanged as e:
+            self.on_remote_changed(e)
+        except Exception as e:
+            logger.error(f"Download error: {str(e)}")
+            self.error_callback(str(e))
+        finally:
+            if session:
+                self.release_session(session)
+                
+    def check_range_response(self, status, response_headers, position):
+        """Raise if the response to a range request cannot be written at position"""
+        if status == 206:
+            return
+        # If-Range gets the whole file back once it no longer matches
+        if_range = self.headers.get('If-Range')
+        if if_range:
+            current = response_headers.get('etag' if if_range.startswith('"') else 'last-modified')
+            if current and current != if_range:
+                raise RemoteFileChanged(response_headers.get('etag'), response_headers.get('last-modified'))
+        # A server that ignores the Range header would send the whole file
+        if position > 0:
+            raise Exception(f"Server does not support range requests (HTTP {status})")
+            
+    def on_remote_changed(self, error):
+        logger.warning(f"{self.url} changed on the server, its downloaded data is stale")
+        if self.changed_callback:
+            self.changed_callback(error)
+        else:
+            self.error_callback(str(error))
+            
+    def acquire_session(self):
+        # Use the shared pool so connections are reused across threads and retries
+        self.session_address = self.address
+        self.session_url = self.url
+        return self.pool.acquire(self.url, self.address) if self.pool else requests.Session()
+        
+    def release_session(self, session):
+        if self.pool:
+            self.pool.release(self.session_url, self.session_address)
+        else:
+            session.close()
             
-            # Use a session for better connection management
-            session = requests.Session()
+    def download_range(self, session):
+        """Download the rest of the range, returns True if a long pause closed the connection"""
+        # Add range header for partial download, open-ended when the size is unknown
+        position = self.start_byte + self.downloaded
+        range_header = f'bytes={position}-{self.end_byte if self.end_byte >= 0 else ""}'
+        self.headers['Range'] = range_header
+        
+        # The probe of a new download leaves its response open for the first bytes
+        response = self.response_callback(position) if self.response_callback else None
+        if response is None:
             response = session.get(self.url, headers=self.headers, stream=True, 
                                  timeout=self.timeout, allow_redirects=True)
+        # Always close the response, an unreleased connection would hold a pool slot forever
+        try:
             response.raise_for_status()
-            
-            # Open file in append mode to continue download
-            with open(self.file_path, 'ab') as f:
-                for chunk in response.iter_content(chunk_size=self.calculate_chunk_size()):
+        
+            self.check_range_response(response.status_code, response.headers, self.start_byte + self.downloaded)
+        
+            # Chunks are written at their absolute offset so several
+            # segment threads can share the same .part file
+            with self.part_file as f:
+                for chunk in self.iter_body(response):
                     if self._stop_event.is_set():
                         break
-                        
-                    # Wait if paused
-                    while self._pause_event.is_set():
-                        time.sleep(0.1)
-                        if self._stop_event.is_set():
-                            break
                     
+                    # Wait if paused, give the connection up if the pause lasts
+                    if not self._resume_event.wait(self.pause_grace):
+                        logger.info(f"Paused longer than {self.pause_grace}s, closing connection for {self.url}")
+                        return True
+                    if self._stop_event.is_set():
+                        break
+                
                     if chunk:
-                        f.write(chunk)
-                        self.downloaded += len(chunk)
-                        
-                        # Calculate speed
-                        current_time = time.time()
-                        time_diff = current_time - self.last_update_time
+                        # end_byte can shrink while we read when another thread
+                        # takes over the tail of our range, never write past it
+                        with self.range_lock:
+                            if self.end_byte >= 0:
+                                chunk = chunk[:self.end_byte + 1 - (self.start_byte + self.downloaded)]
+                            f.write(chunk, self.start_byte + self.downloaded, self)
+                            self.downloaded += len(chunk)
+                    
+                        self.update_speed()
                         
-                        if time_diff >= 0.5:  # Update speed every 0.5 seconds
-                            self.speed = (self.downloaded - self.last_downloaded) / time_diff
-                            self.last_downloaded = self.downloaded
-                            self.last_update_time = current_time
-                            self.speed_samples.append(self.speed)
-                            
                         # Report progress (total downloaded = start_byte + downloaded)
                         if self.progress_callback:
                             self.progress_callback(self.start_byte + self.downloaded, self.speed)
-                            
-                        # Update database
+                        
+                        # Queue database update, the progress writer batches them
                         if self.db_manager and self.db_id:
-                            self.db_manager.update_download_progress(
-                                self.db_id, self.start_byte + self.downloaded, 
+                            self.db_manager.queue_progress(
+                                self.db_id, self.durable_position(), 
                                 self.total_bytes + self.start_byte, 
-                                "paused" if self._pause_event.is_set() else "downloading",
                                 self.speed
                             )
-                            
+                        
                         # Break if download is complete
-                        if self.downloaded >= self.total_bytes:
+                        if self.total_bytes and self.downloaded >= self.total_bytes:
                             break
+                            
+                        # Stay under the bandwidth limits, stop still wakes us up
+                        delay = self.throttle_delay(len(chunk))
+                        if delay:
+                            self._stop_event.wait(delay)
+                            
+                # A finished range is made durable before the thread moves on
+                if self.remaining_bytes() == 0:
+                    f.commit()
+        finally:
+            response.close()
+    
+    def iter_body(self, response):
+        """Yield the response body, read straight into pooled buffers when possible"""
+        fp = getattr(response.raw, "_fp", None)
+        encoding = response.headers.get("content-encoding", "identity").lower()
+        if self.buffer_pool is None or not hasattr(fp, "readinto") or encoding != "identity":
+            while True:
+                size = self.read_size()
+                started = time.perf_counter()
+                for chunk in response.iter_content(chunk_size=size):
+                    self.record_read(size, len(chunk), time.perf_counter() - started)
+                    yield chunk
+                    if self.read_size() != size:
+                        break  # Read on at the new size
+                    started = time.perf_counter()
+                else:
+                    return
             
-            if not self._stop_event.is_set():
-                # Calculate average speed
-                avg_speed = sum(self.speed_samples) / len(self.speed_samples) if self.speed_samples else 0
-                self.complete_callback(avg_speed)
-                
-        except requests.exceptions.ChunkedEncodingError as e:
-            # Handle incomplete read errors by retrying
-            if self.retry_count < self.max_retries:
-                self.retry_count += 1
-                logger.warning(f"ChunkedEncodingError occurred, retrying {self.retry_count}/{self.max_retries}")
-                time.sleep(1)  # Wait before retrying
-                self.run()  # Retry the download
-            else:
-                logger.error(f"Failed after {self.max_retries} retries: {str(e)}")
-                self.error_callback(f"Failed after {self.max_retries} retries: {str(e)}")
-        except Exception as e:
-            logger.error(f"Download error: {str(e)}")
-            self.error_callback(str(e))
+        while True:
+            size = self.read_size()
+            buffer = self.buffer_pool.acquire(size)
+            started = time.perf_counter()
+            count = fp.readinto(memoryview(buffer)[:size])
+            self.record_read(size, count, time.perf_counter() - started)
+            if not count and fp.length:
+                # http.client reports a body cut short as a plain end of stream
+                raise http.client.IncompleteRead(b"", fp.length)
+            if fp.isclosed():
+                # Body read to the end, the connection can serve the next request
+                response.raw.release_conn()
+            if not count:
+                self.buffer_pool.release(buffer)
+                return
+            yield memoryview(buffer)[:count]
+            
+    def update_speed(self):
+        current_time = time.time()
+        time_diff = current_time - self.last_update_time
+        
+        if time_diff >= 0.5:  # Update speed every 0.5 seconds
+            self.speed = (self.downloaded - self.last_downloaded) / time_diff
+            self.last_downloaded = self.downloaded
+            self.last_update_time = current_time
+            self.speed_samples.append(self.speed)
+        self.last_received = current_time
     
     def calculate_chunk_size(self):
-        # Handle AUTO chunk size
+        # Handle AUTO chunk size, steered by record_read
         if self.chunk_size_setting == "AUTO":
-            # Dynamic chunk sizing based on network speed
-            if self.speed > 0:
-                # Aim for chunks that take about 0.1 seconds to download
-                dynamic_size = max(65536, min(1048576, int(self.speed * 0.1)))
-                logger.debug(f"Auto chunk size: {dynamic_size} based on speed: {self.speed}")
-                return dynamic_size
-            return DEFAULT_CHUNK_SIZE
+            return self.auto_read_size
         else:
             # Use the fixed chunk size
             try:
@@ -349,20 +2076,480 @@ class DownloadThread(threading.Thread):
             except:
                 return DEFAULT_CHUNK_SIZE
     
+    def record_read(self, requested, count, elapsed):
+        """Steer the AUTO read size towards reads that take about AUTO_READ_TIME.
+        
+        A read that filled its buffer in under half that time doubles the
+        size, data is waiting faster than it is picked up. A read that took
+        over twice as long shrinks it to what the link delivered in
+        AUTO_READ_TIME, so slow links still report progress and notice
+        pauses promptly. Sizes stay powers of two to match the BufferPool.
+        """
+        if self.chunk_size_setting != "AUTO" or requested < self.auto_read_size:
+            return  # Capped by a rate limiter or the end of the body, says nothing about the link
+        if elapsed < AUTO_READ_TIME / 2 and count >= requested:
+            # The write-behind buffer holds every segment's reads, leave room for eight
+            limit = min(AUTO_MAX_READ_SIZE, getattr(self.part_file, "buffer_size", WRITE_BUFFER_SIZE) // 8)
+            self.auto_read_size = max(AUTO_MIN_READ_SIZE, min(limit, self.auto_read_size * 2))
+        elif elapsed > AUTO_READ_TIME * 2:
+            fitting = max(AUTO_MIN_READ_SIZE, int(count * AUTO_READ_TIME / elapsed))
+            self.auto_read_size = min(self.auto_read_size, 1 << (fitting.bit_length() - 1))
+            
+    def next_retry(self):
+        """Count a failed attempt, returns False once max_retries failed in a row"""
+        position = self.start_byte + self.downloaded
+        if position > self.failed_position:
+            # Progress since the last failure, the mirror is flaky rather than down
+            self.retry_attempt = 0
+        self.failed_position = position
+        if self.retry_attempt >= self.max_retries:
+            return False
+        self.retry_attempt += 1
+        self.retry_count += 1
+        return True
+        
+    def retry_delay(self, error):
+        """Capped exponential backoff with jitter, at least what Retry-After asks for"""
+        backoff = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (self.retry_attempt - 1))
+        delay = backoff / 2 + random.uniform(0, backoff / 2)
+        
+        retry_after = getattr(error, "retry_after", None)
+        response = getattr(error, "response", None)
+        if retry_after is None and response is not None:
+            retry_after = response.headers.get("Retry-After")
+        if retry_after and str(retry_after).isdigit():
+            delay = max(delay, min(RETRY_MAX_DELAY, int(retry_after)))
+        return delay
+        
+    def rewind_to_persisted(self):
+        """Continue from the durable position, the offset a resume would start from"""
+        # The .part file is preallocated, its size says nothing about what was written
+        with self.range_lock:
+            persisted = self.durable_position() - self.start_byte
+            if persisted < self.downloaded:
+                logger.info(f"Rewinding {self.url} by {self.downloaded - persisted} bytes not on disk")
+                self.refetched_bytes += self.downloaded - persisted
+                self.downloaded = persisted
+                
+    def read_size(self):
+        """Chunk size to read, kept small enough for the rate limiters to pace it"""
+        size = self.calculate_chunk_size()
+        for limiter in self.rate_limiters:
+            max_chunk = limiter.max_chunk()
+            if max_chunk:
+                size = min(size, max_chunk)
+        return size
+        
+    def throttle_delay(self, amount):
+        """Charge amount bytes to every rate limiter and return how long to wait"""
+        return max([limiter.reserve(amount) for limiter in self.rate_limiters], default=0)
+    
     def stop(self):
         self._stop_event.set()
+        self._resume_event.set()  # Wake a paused transfer so it can exit
         
     def pause(self):
         self._pause_event.set()
+        self._resume_event.clear()
         
     def resume(self):
+        self.last_received = time.time()  # Waiting while paused is not a stall
         self._pause_event.clear()
+        self._resume_event.set()
         
     def is_paused(self):
         return self._pause_event.is_set()
         
     def is_stopped(self):
         return self._stop_event.is_set()
+        
+    def average_speed(self):
+        return sum(self.speed_samples) / len(self.speed_samples) if self.speed_samples else 0
+        
+    def range_speed(self):
+        """Bytes per second over the current range, connecting and waiting for the response included"""
+        elapsed = time.time() - self.range_started if self.range_started else 0
+        return self.downloaded / elapsed if elapsed > 0 else 0
+        
+    def remaining_bytes(self):
+        return max(0, self.end_byte + 1 - (self.start_byte + self.downloaded))
+        
+    def idle_time(self):
+        """Seconds since data last arrived, or since the range began or the transfer resumed"""
+        return time.time() - max(self.last_received, self.range_started or 0)
+        
+    def durable_position(self):
+        """First byte of the range that is not safely on disk yet"""
+        return min(self.start_byte + self.downloaded, max(self.start_byte, self.durable_offset))
+        
+    def get_range(self):
+        """Return (start_byte, end_byte, position) where position is the first byte a resume must fetch"""
+        with self.range_lock:
+            return self.start_byte, self.end_byte, self.durable_position()
+        
+    def split(self, min_segment_size):
+        """Hand off the second half of the remaining range, returns (start, end) or None"""
+        with self.range_lock:
+            position = self.start_byte + self.downloaded
+            remaining = self.end_byte + 1 - position
+            if remaining < 2 * min_segment_size:
+                return None
+            middle = position + remaining // 2
+            end_byte = self.end_byte
+            self.end_byte = middle - 1
+            self.total_bytes = self.end_byte - self.start_byte + 1
+            return middle, end_byte
+            
+    def give_up_range(self):
+        """Stop and hand off the rest of the range, returns (start, end) or None if nothing was left"""
+        with self.range_lock:
+            position = self.start_byte + self.downloaded
+            end_byte = self.end_byte
+            # Data still in flight is cut off at position, as after a split
+            self.end_byte = position - 1
+            self.total_bytes = max(0, self.end_byte - self.start_byte + 1)
+        self.stop()
+        return (position, end_byte) if position <= end_byte else None
+        
+    def use_mirror(self, url, headers):
+        """Fetch from another URL of the same file from the next request on"""
+        self.url = url
+        self.headers = headers
+            
+    def assign_range(self, start_byte, end_byte):
+        with self.range_lock:
+            self.start_byte = start_byte
+            self.end_byte = end_byte
+            self.durable_offset = start_byte
+            self.downloaded = 0
+            self.last_downloaded = 0
+            self.total_bytes = end_byte - start_byte + 1
+            self.range_started = time.time()
+
+
+class AsyncDownloadEngine:
+    """Runs every transfer as a coroutine on one event loop thread"""
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.ssl_context = ssl.create_default_context()
+        logger.info("Async download engine started")
+        
+    def submit(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        
+    def call(self, callback, *args):
+        self.loop.call_soon_threadsafe(callback, *args)
+        
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+class AsyncDownloadTask(DownloadThread):
+    """A DownloadThread that runs on the AsyncDownloadEngine loop instead of its own thread.
+    
+    Reads use non-blocking sockets through asyncio streams, and a paused
+    task just waits on an event, so thousands of slow transfers cost one
+    OS thread between them.
+    """
+    def __init__(self, engine, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.engine = engine
+        self.future = None
+        self.resume_signal = None  # asyncio.Event, created on the loop
+        self.connection = None  # (host key, reader, writer) kept alive between ranges
+        self.host_slot = None  # Semaphore of the pool's per-host cap, held along with the connection
+        self.resolved_url = None  # URL after redirects
+        self.body_complete = False  # Whether the last response body was read to the end
+        
+    @property
+    def ident(self):
+        return id(self) if self.future else None
+        
+    def start(self):
+        self.future = self.engine.submit(self.run_async())
+        
+    def is_alive(self):
+        return self.future is not None and not self.future.done()
+        
+    def resume(self):
+        super().resume()
+        if self.resume_signal:
+            self.engine.call(self.resume_signal.set)
+            
+    def stop(self):
+        super().stop()
+        if self.future:
+            self.future.cancel()
+            
+    def use_mirror(self, url, headers):
+        super().use_mirror(url, headers)
+        self.resolved_url = None  # Redirects of the previous URL don't apply
+            
+    async def run_async(self):
+        self.resume_signal = asyncio.Event()
+        self.range_started = time.time()
+        try:
+            while True:
+                try:
+                    released = await self.download_range_async()
+                except Exception as e:
+                    # Handle dropped connections and server errors by retrying
+                    self.close_connection()
+                    if not is_transient_error(e):
+                        raise
+                    if not self.next_retry():
+                        raise Exception(f"Failed after {self.max_retries} retries: {str(e)}")
+                    delay = self.retry_delay(e)
+                    logger.warning(f"{type(e).__name__} at byte {self.start_byte + self.downloaded}, "
+                                   f"retrying {self.retry_attempt}/{self.max_retries} in {delay:.1f}s: {str(e)}")
+                    await asyncio.sleep(delay)
+                    self.rewind_to_persisted()
+                    continue
+                    
+                if self._stop_event.is_set():
+                    return
+                if released:
+                    # Paused past the grace period, wait holding neither socket nor file
+                    await self.wait_for_resume()
+                    if self._stop_event.is_set():
+                        return
+                    continue
+                # Ask for more work before finishing so the connection stays busy
+                if not (self.next_range_callback and self.next_range_callback(self)):
+                    break
+                    
+            self.completed = True
+            self.complete_callback(self.average_speed())
+            
+        except asyncio.CancelledError:
+            pass
+        except RemoteFileChanged as e:
+            self.on_remote_changed(e)
+        except Exception as e:
+            logger.error(f"Download error: {str(e)}")
+            self.error_callback(str(e))
+        finally:
+            self.close_connection()
+            
+    async def download_range_async(self):
+        """Download the rest of the range, returns True if a long pause closed the connection"""
+        position = self.start_byte + self.downloaded
+        headers = dict(self.headers)
+        headers['Range'] = f'bytes={position}-{self.end_byte if self.end_byte >= 0 else ""}'
+        
+        status, response_headers, reader = await self.open_response(headers)
+        if status >= 400:
+            self.close_connection()
+            raise HTTPStatusError(status, response_headers.get('retry-after'))
+        
+        self.check_range_response(status, response_headers, position)
+            
+        self.body_complete = False
+        # Opening the file can preallocate it, which must not block the event loop
+        f = None
+        opening = asyncio.ensure_future(asyncio.to_thread(self.part_file.__enter__))
+        try:
+            f = await asyncio.shield(opening)
+            async for chunk in self.read_body(reader, response_headers):
+                if self._stop_event.is_set():
+                    break
+                    
+                # Wait if paused, give the connection up if the pause lasts
+                if not await self.wait_for_resume(self.pause_grace):
+                    logger.info(f"Paused longer than {self.pause_grace}s, closing connection for {self.url}")
+                    self.close_connection()
+                    return True
+                        
+                # A full write buffer must not block the event loop
+                if not f.has_room(len(chunk)):
+                    await asyncio.to_thread(f.wait_for_room, len(chunk))
+                    
+                with self.range_lock:
+                    chunk = chunk[:self.end_byte + 1 - (self.start_byte + self.downloaded)] if self.end_byte >= 0 else chunk
+                    f.write(chunk, self.start_byte + self.downloaded, self)
+                    self.downloaded += len(chunk)
+                    
+                self.update_speed()
+                
+                if self.progress_callback:
+                    self.progress_callback(self.start_byte + self.downloaded, self.speed)
+                    
+                # Queue database update, the progress writer batches them
+                if self.db_manager and self.db_id:
+                    self.db_manager.queue_progress(
+                        self.db_id, self.durable_position(),
+                        self.total_bytes + self.start_byte,
+                        self.speed
+                    )
+                    
+                if self.total_bytes and self.downloaded >= self.total_bytes:
+                    break
+                    
+                # Stay under the bandwidth limits
+                delay = self.throttle_delay(len(chunk))
+                if delay:
+                    await asyncio.sleep(delay)
+                    
+            # A finished range is made durable before the task moves on
+            if self.remaining_bytes() == 0:
+                await asyncio.to_thread(f.commit)
+        finally:
+            if f is None:
+                # Stopped while the file opened, the thread opens it all the same
+                try:
+                    f = await opening
+                except Exception:
+                    pass
+            # The last user waits for the buffer to drain and syncs, off the loop as well
+            if f is not None:
+                await asyncio.to_thread(f.__exit__, None, None, None)
+                
+        # The connection can only carry the next request if the body was read to the end
+        if not self.body_complete or response_headers.get('connection', '').lower() == 'close':
+            self.close_connection()
+            
+    async def wait_for_resume(self, timeout=None):
+        """Wait without polling while paused, returns False if timeout ran out first"""
+        while self._pause_event.is_set() and not self._stop_event.is_set():
+            self.resume_signal.clear()
+            if self._pause_event.is_set():
+                try:
+                    await asyncio.wait_for(self.resume_signal.wait(), timeout)
+                except asyncio.TimeoutError:
+                    return False
+        return True
+        
+    async def open_response(self, headers, max_redirects=5):
+        url = self.resolved_url or self.url
+        for _ in range(max_redirects + 1):
+            parsed = urlparse(url)
+            reader, writer = await self.get_connection(parsed)
+            
+            target = (parsed.path or "/") + (f"?{parsed.query}" if parsed.query else "")
+            lines = [f"GET {target} HTTP/1.1", f"Host: {parsed.netloc}",
+                     "Accept-Encoding: identity", "Connection: keep-alive"]
+            lines += [f"{key}: {value}" for key, value in headers.items()]
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+            await writer.drain()
+            
+            status_line = await asyncio.wait_for(reader.readline(), self.timeout)
+            if not status_line:
+                raise ConnectionResetError("Connection closed by server")
+            status = int(status_line.split()[1])
+            
+            response_headers = {}
+            while True:
+                line = await asyncio.wait_for(reader.readline(), self.timeout)
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                key, _, value = line.decode("latin-1").partition(":")
+                response_headers[key.strip().lower()] = value.strip()
+                
+            if status in (301, 302, 303, 307, 308) and 'location' in response_headers:
+                # Drain the redirect body so the connection can be reused
+                async for _ in self.read_body(reader, response_headers):
+                    pass
+                url = urljoin(url, response_headers['location'])
+                continue
+                
+            self.resolved_url = url
+            return status, response_headers, reader
+            
+        raise Exception("Too many redirects")
+        
+    async def get_connection(self, parsed):
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        # Redirects to another host don't use the pinned address
+        address = self.address if parsed.hostname == urlparse(self.url).hostname else None
+        key = (parsed.scheme, parsed.hostname, port, address)
+        if self.connection and self.connection[0] == key:
+            return self.connection[1], self.connection[2]
+            
+        self.close_connection()
+        resolver = self.pool.resolver if self.pool else Resolver()
+        if self.pool:
+            await self.acquire_host_slot(self.pool.host_slots(parsed.scheme, parsed.hostname, port))
+        try:
+            sock = await resolver.connect_async(parsed.hostname, port, self.timeout, address,
+                                                [(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)])
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(
+                    sock=sock,
+                    ssl=self.engine.ssl_context if parsed.scheme == "https" else None,
+                    server_hostname=parsed.hostname if parsed.scheme == "https" else None
+                ),
+                self.timeout
+            )
+        except BaseException:
+            self.release_host_slot()
+            raise
+        self.connection = (key, reader, writer)
+        return reader, writer
+        
+    async def acquire_host_slot(self, slots):
+        """Take one of the host's connection slots shared with the threaded engine, polls so the loop never blocks"""
+        deadline = time.monotonic() + self.timeout
+        while not slots.acquire(blocking=False):
+            if time.monotonic() >= deadline:
+                raise asyncio.TimeoutError("No free connection slot for the host")
+            await asyncio.sleep(HOST_SLOT_POLL_INTERVAL)
+        self.host_slot = slots
+        
+    def release_host_slot(self):
+        if self.host_slot:
+            self.host_slot.release()
+            self.host_slot = None
+            
+    def close_connection(self):
+        if self.connection:
+            self.connection[2].close()
+            self.connection = None
+        self.release_host_slot()
+            
+    async def timed_read(self, reader, size):
+        """Up to size bytes of body, the time it took steers the AUTO read size"""
+        started = time.perf_counter()
+        data = await asyncio.wait_for(reader.read(size), self.timeout)
+        self.record_read(size, len(data), time.perf_counter() - started)
+        return data
+        
+    async def read_body(self, reader, response_headers):
+        if response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size_line = await asyncio.wait_for(reader.readline(), self.timeout)
+                size = int(size_line.split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    # Skip trailers
+                    while (await asyncio.wait_for(reader.readline(), self.timeout)) not in (b"\r\n", b"\n", b""):
+                        pass
+                    self.body_complete = True
+                    return
+                while size > 0:
+                    data = await self.timed_read(reader, min(size, self.read_size()))
+                    if not data:
+                        raise asyncio.IncompleteReadError(b"", size)
+                    size -= len(data)
+                    yield data
+                await asyncio.wait_for(reader.readline(), self.timeout)
+        elif 'content-length' in response_headers:
+            remaining = int(response_headers['content-length'])
+            while remaining > 0:
+                data = await self.timed_read(reader, min(remaining, self.read_size()))
+                if not data:
+                    raise asyncio.IncompleteReadError(b"", remaining)
+                remaining -= len(data)
+                self.body_complete = remaining == 0
+                yield data
+        else:
+            # Body ends when the server closes the connection
+            while True:
+                data = await self.timed_read(reader, self.read_size())
+                if not data:
+                    self.body_complete = True
+                    return
+                yield data
 
 
 class DownloadManager:
@@ -370,8 +2557,188 @@ class DownloadManager:
         self.downloads = {}
         self.db = DownloadDB()
         self.config = self.load_config()
+        self.progress_writer = ProgressWriter(self.db, self.config["progress_flush_interval"], self.checkpoint)
+        self.resolver = Resolver(self.config["dns_cache_ttl"])
+        self.pool = ConnectionPool(self.config["max_connections"], self.config["pool_idle_timeout"], self.resolver)
+        self.async_engine = None  # Started on first use
+        self.schedule_lock = threading.RLock()
+        self.queue_counter = 0  # Keeps first-come order within a priority
+        self.rate_limiter = RateLimiter(self.config["global_speed_limit"] * 1024)
+        self.download_limiters = {}  # url -> RateLimiter shared by the download's transfers
+        self.part_files = {}  # .part path -> PartFile shared by the download's transfers
+        self.buffer_pool = BufferPool()
+        self.extractors = {}  # url -> Extractor unpacking the download
+        self.probe_cache = ProbeCache(self.config["probe_cache_ttl"])
+        self.probe_responses = {}  # url -> open probe response the first transfer reads on from
+        self.probe_lock = threading.Lock()
+        self.progress_writer.start()
         logger.info("DownloadManager initialized")
         
+    def shutdown(self):
+        for extractor in list(self.extractors.values()):
+            extractor.stop()
+        with self.probe_lock:
+            responses, self.probe_responses = list(self.probe_responses.values()), {}
+        for response in responses:
+            response.close()
+        self.progress_writer.stop()
+        self.pool.close()
+        if self.async_engine:
+            self.async_engine.stop()
+        logger.info("DownloadManager shut down")
+        
+    def new_transfer(self, *args, **kwargs):
+        """Create a transfer for the configured engine, a thread or an asyncio task"""
+        kwargs.setdefault("pause_grace", self.config["pause_grace_period"])
+        kwargs.setdefault("changed_callback", lambda error: self.on_remote_changed(args[0]))
+        kwargs.setdefault("part_file", self.get_part_file(args[1]))
+        kwargs.setdefault("response_callback", lambda position: self.take_probe_response(args[0], position))
+        if self.config["receive_mode"] == "readinto":
+            kwargs.setdefault("buffer_pool", self.buffer_pool)
+        if self.config["engine"] == "asyncio":
+            if self.async_engine is None:
+                self.async_engine = AsyncDownloadEngine()
+            return AsyncDownloadTask(self.async_engine, *args, **kwargs)
+        return DownloadThread(*args, **kwargs)
+        
+    def init_storage(self, db_id, path, storage=None):
+        """Pick the storage backend of a download before its transfers exist, returns its name"""
+        storage = storage or self.config["storage_backend"]
+        self.db.set_storage(db_id, storage)
+        self.get_part_file(path, storage)
+        return storage
+        
+    def init_checksum(self, db_id, path, checksum=None):
+        """Hash the download while it is written if it has an expected checksum, returns the checksum"""
+        if checksum:
+            self.db.set_expected_checksum(db_id, checksum)
+        else:
+            checksum = self.db.get_expected_checksum(db_id)
+        part_file = self.get_part_file(path)
+        if checksum and not self.get_hasher(part_file):
+            part_file.watchers.append(StreamingHash(checksum.split(":")[0], path))
+        return checksum
+        
+    def get_hasher(self, part_file):
+        return next((watcher for watcher in part_file.watchers if isinstance(watcher, StreamingHash)), None)
+        
+    def init_extraction(self, url, db_id, file_path, size, extract=False, complete=False):
+        """Start unpacking the download as it arrives if that was asked for, returns whether it was"""
+        if extract:
+            self.db.set_extract(db_id, True)
+        else:
+            extract = self.db.get_extract(db_id)
+        archive = archive_type(os.path.basename(file_path))
+        if not extract:
+            return False
+        if not archive or (archive[0] == "zst" and zstandard is None):
+            logger.warning(f"Cannot extract {file_path}, not a supported archive")
+            return False
+            
+        kind, suffix = archive
+        prefix = WrittenPrefix()
+        source = file_path
+        if not complete:
+            source = file_path + ".part"
+            self.get_part_file(source).watchers.append(prefix)
+        self.stop_extraction(url)
+        extractor = Extractor(source, size, file_path[:-len(suffix)], kind, prefix, complete)
+        self.extractors[url] = extractor
+        extractor.start()
+        return True
+        
+    def stop_extraction(self, url):
+        extractor = self.extractors.pop(url, None)
+        if extractor:
+            extractor.stop()
+            
+    def get_extract_stats(self, url):
+        """Progress of the download's extraction stage, None without one"""
+        extractor = self.extractors.get(url)
+        return extractor.get_stats() if extractor else None
+        
+    def verify_checksum(self, download, part_file):
+        """Finish hashing the .part file, stores the digest and returns True if it matches"""
+        algorithm, expected = download["checksum"].split(":")
+        hasher = (part_file and self.get_hasher(part_file)) or StreamingHash(algorithm, download["temp_path"])
+        try:
+            digest = hasher.finish(download["temp_path"])
+        except OSError as e:
+            logger.error(f"Error hashing {download['temp_path']}: {str(e)}")
+            return False
+        if digest != expected:
+            logger.error(f"{algorithm} mismatch for {download['temp_path']}: expected {expected}, got {digest}")
+            return False
+        self.db.set_checksum(download["db_id"], f"{algorithm}:{digest}")
+        logger.info(f"Verified {algorithm} of {download['temp_path']}")
+        return True
+        
+    def get_part_file(self, path, storage=None):
+        """PartFile shared by every transfer writing to path"""
+        if path not in self.part_files:
+            part_file_class = MappedPartFile if (storage or self.config["storage_backend"]) == "mmap" else PartFile
+            self.part_files[path] = part_file_class(
+                path, self.config["write_buffer_size"], self.config["fsync_policy"],
+                self.config["fsync_interval"] * 1024 * 1024, self.buffer_pool
+            )
+        return self.part_files[path]
+        
+    def get_writer_stats(self, url):
+        """Write-behind buffer occupancy and latency of a download, None before it wrote anything"""
+        download = self.downloads.get(url)
+        part_file = self.part_files.get(download["temp_path"]) if download else None
+        return part_file.get_stats() if part_file else None
+        
+    def checkpoint(self):
+        """Make buffered file data durable, then queue the resume offsets that are now safe"""
+        for part_file in list(self.part_files.values()):
+            try:
+                part_file.checkpoint()
+            except OSError as e:
+                logger.error(f"Error syncing {part_file.path}: {str(e)}")
+        for url, download in list(self.downloads.items()):
+            if download["status"] == "downloading":
+                self.queue_state(download)
+                # Housekeeping of one download can't hold back the others or the progress flush
+                try:
+                    if download.get("mirrors"):
+                        self.check_stalled_mirrors(url, download)
+                except Exception as e:
+                    logger.error(f"Error checking mirrors of {url}: {str(e)}")
+                try:
+                    if download.get("tuner"):
+                        self.tune_connections(url, download)
+                except Exception as e:
+                    logger.error(f"Error tuning connections of {url}: {str(e)}")
+        
+    def get_rate_limiters(self, url):
+        """Rate limiters a transfer of url has to respect"""
+        if url not in self.download_limiters:
+            self.download_limiters[url] = RateLimiter(self.config["download_speed_limit"] * 1024)
+        return [self.rate_limiter, self.download_limiters[url]]
+        
+    def apply_speed_limits(self):
+        """Push the configured limits to the running transfers"""
+        self.rate_limiter.set_rate(self.config["global_speed_limit"] * 1024)
+        for url, limiter in list(self.download_limiters.items()):
+            speed_limit = self.downloads[url].get("speed_limit") if url in self.downloads else None
+            if speed_limit is None:
+                speed_limit = self.config["download_speed_limit"]
+            limiter.set_rate(speed_limit * 1024)
+            
+    def set_speed_limit(self, url, speed_limit):
+        """Cap one download in KB/s, 0 for unlimited or None to use the default"""
+        if url in self.downloads:
+            download = self.downloads[url]
+            download["speed_limit"] = speed_limit
+            self.db.set_speed_limit(download["db_id"], speed_limit)
+            self.apply_speed_limits()
+            logger.info(f"Set speed limit of {url} to {speed_limit}")
+            
+    def get_pool_stats(self):
+        """Connection reuse counters of the shared HTTP pool"""
+        return self.pool.get_stats()
+        
     def load_config(self):
         # Load settings from database instead of JSON
         config = {
@@ -380,7 +2747,30 @@ class DownloadManager:
             "chunk_size": self.db.get_setting("chunk_size") or DEFAULT_CHUNK_SIZE,
             "timeout": int(self.db.get_setting("timeout") or 30),
             "theme": self.db.get_setting("theme") or "light",
-            "proxy": self.db.get_setting("proxy") or None
+            "proxy": self.db.get_setting("proxy") or None,
+            "threads_per_download": int(self.db.get_setting("threads_per_download") or THREADS_PER_DOWNLOAD),
+            "min_segment_size": int(self.db.get_setting("min_segment_size") or MIN_SEGMENT_SIZE),
+            "progress_flush_interval": float(self.db.get_setting("progress_flush_interval") or PROGRESS_FLUSH_INTERVAL),
+            "pool_idle_timeout": int(self.db.get_setting("pool_idle_timeout") or POOL_IDLE_TIMEOUT),
+            "engine": self.db.get_setting("engine") or "threads",
+            "max_active_downloads": int(self.db.get_setting("max_active_downloads") or MAX_ACTIVE_DOWNLOADS),
+            "max_downloads_per_host": int(self.db.get_setting("max_downloads_per_host") or MAX_DOWNLOADS_PER_HOST),
+            "pause_grace_period": float(self.db.get_setting("pause_grace_period") or PAUSE_GRACE_PERIOD),
+            "write_buffer_size": int(self.db.get_setting("write_buffer_size") or WRITE_BUFFER_SIZE),
+            "fsync_policy": self.db.get_setting("fsync_policy") or "checkpoint",  # never, size or checkpoint
+            "receive_mode": self.db.get_setting("receive_mode") or "readinto",  # readinto or iter_content
+            "storage_backend": self.db.get_setting("storage_backend") or "file",  # file or mmap, for new downloads
+            "fsync_interval": int(self.db.get_setting("fsync_interval") or FSYNC_INTERVAL // (1024 * 1024)),  # MB
+            # Bandwidth limits in KB/s, 0 means unlimited
+            "global_speed_limit": int(self.db.get_setting("global_speed_limit") or 0),
+            "download_speed_limit": int(self.db.get_setting("download_speed_limit") or 0),
+            "probe_cache_ttl": int(self.db.get_setting("probe_cache_ttl") or PROBE_CACHE_TTL),
+            "probe_workers": int(self.db.get_setting("probe_workers") or PROBE_WORKERS),
+            "dns_cache_ttl": int(self.db.get_setting("dns_cache_ttl") or DNS_CACHE_TTL),
+            "mirror_stall_timeout": int(self.db.get_setting("mirror_stall_timeout") or MIRROR_STALL_TIMEOUT),
+            # fixed uses threads_per_download, auto tunes each download up to max_connections
+            "connection_tuning": self.db.get_setting("connection_tuning") or "fixed",
+            "max_total_connections": int(self.db.get_setting("max_total_connections") or MAX_TOTAL_CONNECTIONS)
         }
         
         # Handle chunk_size being stored as string
@@ -396,54 +2786,174 @@ class DownloadManager:
             self.db.set_setting(key, value)
         logger.info("Config saved to database")
             
-    def get_file_size(self, url, headers=None):
+    def build_headers(self, db_id=None, validators=None):
+        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+        if self.config["proxy"]:
+            headers['Proxy'] = self.config["proxy"]
+        if db_id is not None:
+            validators = self.db.get_validators(db_id)
+        if validators:
+            # Ranges only fit the file the .part data came from, If-Range makes
+            # the server send the whole file instead once it has changed
+            etag, last_modified = validators
+            validator = etag if etag and not etag.startswith("W/") else last_modified
+            if validator:
+                headers['If-Range'] = validator
+        return headers
+            
+    def probe_url(self, url, headers=None, keep=False):
+        """Probe a URL with a ranged GET, returns its size, range support, validators, final URL and content type.
+        
+        With keep the request asks for the whole file and the response is
+        parked for the transfer that starts at byte 0, which reads on from it
+        instead of sending a request of its own. The parked response holds
+        one of the host's pooled connections, so keep is only for downloads
+        that start right away. Otherwise only the first byte is asked for. Plain probes are answered from the probe cache while it
+        is fresh, headers with conditions always go to the server.
+        """
+        if not headers:
+            info = self.probe_cache.get(url)
+            if info:
+                return info
+        keep = keep and self.config["engine"] == "threads"  # asyncio transfers open their own connections
+        request_headers = self.build_headers()
+        request_headers.update(headers or {})
+        request_headers['Range'] = 'bytes=0-' if keep else 'bytes=0-0'
+        session = self.pool.acquire(url)
+        response = None
         try:
-            response = requests.head(url, headers=headers, allow_redirects=True, 
+            response = session.get(url, headers=request_headers, stream=True, allow_redirects=True,
                                    timeout=self.config["timeout"])
-            response.raise_for_status()
-            size = int(response.headers.get('content-length', 0))
-            logger.info(f"File size for {url}: {size} bytes")
-            return size
+            if response.status_code != 416:  # Range not satisfiable, the file is empty
+                response.raise_for_status()
+            info = {
+                "size": self.parse_probe_size(response),
+                "accepts_ranges": response.status_code in (206, 416),  # 200 means the Range was ignored
+                "etag": response.headers.get('etag'),
+                "last_modified": response.headers.get('last-modified'),
+                "final_url": response.url,
+                "content_type": response.headers.get('content-type'),
+                "not_modified": response.status_code == 304  # Answer to a conditional probe
+            }
+            logger.info(f"File size for {url}: {info['size']} bytes (ranges: {info['accepts_ranges']})")
+            if not info["not_modified"]:
+                self.probe_cache.put(url, info)
+            if keep and response.status_code in (200, 206):
+                self.park_probe_response(url, response)
+                response = None
+            elif response.status_code == 206:
+                response.content  # One byte, reading it lets the connection be reused
+            return info
         except Exception as e:
             logger.error(f"Error getting file size for {url}: {str(e)}")
-            return 0
+            return {"size": 0, "accepts_ranges": False, "etag": None, "last_modified": None,
+                    "final_url": url, "content_type": None, "not_modified": False}
+        finally:
+            if response is not None:
+                response.close()
+            self.pool.release(url)
+            
+    def parse_probe_size(self, response):
+        """Full size of the file a probe response belongs to, 0 if the server doesn't say"""
+        content_range = response.headers.get('content-range', '')
+        if response.status_code in (206, 416) and '/' in content_range:
+            total = content_range.rsplit('/', 1)[1].strip()
+            return int(total) if total.isdigit() else 0
+        if response.status_code == 200:
+            return int(response.headers.get('content-length', 0))
+        return 0
+        
+    def park_probe_response(self, url, response):
+        """Keep a probe response open for the download's first transfer, for pause_grace_period seconds"""
+        with self.probe_lock:
+            previous = self.probe_responses.pop(url, None)
+            self.probe_responses[url] = response
+        if previous:
+            previous.close()
+        timer = threading.Timer(self.config["pause_grace_period"], self.drop_probe_response, args=(url, response))
+        timer.daemon = True
+        timer.start()
+        
+    def take_probe_response(self, url, position):
+        """The parked probe response of url if a transfer can read on from it at position"""
+        with self.probe_lock:
+            response = self.probe_responses.pop(url, None)
+        if response and position != 0:
+            response.close()  # A resume, the response starts at the wrong byte
+            return None
+        if response:
+            logger.debug(f"Reusing the probe response for {url}")
+        return response
+        
+    def close_probe_response(self, url):
+        with self.probe_lock:
+            response = self.probe_responses.pop(url, None)
+        if response:
+            response.close()
+            
+    def drop_probe_response(self, url, response):
+        with self.probe_lock:
+            if self.probe_responses.get(url) is not response:
+                return  # Already taken
+            del self.probe_responses[url]
+        response.close()
+        
+    def get_file_info(self, url, headers=None):
+        """Return (size, accepts_ranges) for a URL"""
+        info = self.probe_url(url, headers)
+        return info["size"], info["accepts_ranges"]
+            
+    def get_file_size(self, url, headers=None):
+        return self.get_file_info(url, headers)[0]
             
     def create_download(self, url, file_name=None, progress_callback=None, 
-                       complete_callback=None, error_callback=None):
+                       complete_callback=None, error_callback=None, storage=None, checksum=None, extract=False):
+        if checksum:
+            checksum = parse_checksum(checksum)  # Reject a bad checksum before anything is stored
         if not file_name:
             file_name = os.path.basename(urlparse(url).path) or "download"
             
         file_path = os.path.join(self.config["save_path"], file_name)
         temp_file_path = file_path + ".part"
         
-        # Check for existing partial download
-        start_byte = 0
-        if os.path.exists(temp_file_path):
-            start_byte = os.path.getsize(temp_file_path)
+        info, duplicate = self.probe_new_download(url, checksum)
+        if duplicate:
+            return self.create_linked_download(url, file_name, duplicate, complete_callback, extract)
+        file_size = info["size"]
+        
+        # Check for existing partial download, a single stream resumes
+        # from the first byte that is still missing
+        db_id, ranges = self.get_resume_ranges(url, file_name, file_size, info)
+        start_byte = ranges[0][0] if ranges else 0
+        if start_byte > 0:
             logger.info(f"Resuming download from byte {start_byte}")
             
-        file_size = self.get_file_size(url)
+        # Add to database
+        if db_id is None:
+            db_id = self.db.add_download(url, file_name, self.config["save_path"])
+            logger.info(f"Added download to database with ID: {db_id}")
+        self.db.queue_segments(db_id, [])
+        self.save_validators(db_id, info)
         
         # Headers
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-        if self.config["proxy"]:
-            headers['Proxy'] = self.config["proxy"]
-            
-        # Add to database
-        db_id = self.db.add_download(url, file_name, self.config["save_path"])
-        logger.info(f"Added download to database with ID: {db_id}")
+        headers = self.build_headers(db_id)
+        storage = self.init_storage(db_id, temp_file_path, storage)
+        checksum = self.init_checksum(db_id, temp_file_path, checksum)
+        extract = self.init_extraction(url, db_id, file_path, file_size, extract)
             
         # Create download thread
-        thread = DownloadThread(
+        thread = self.new_transfer(
             url, temp_file_path, start_byte, file_size - 1,
             progress_callback, 
-            lambda avg_speed: self.on_download_complete(url, temp_file_path, file_path, complete_callback, avg_speed),
+            lambda avg_speed: self.finish_download(url, temp_file_path, file_path, complete_callback, avg_speed),
             error_callback,
             headers,
             self.config["timeout"],
             db_id,
             self.db,
-            self.config["chunk_size"]
+            self.config["chunk_size"],
+            pool=self.pool,
+            rate_limiters=self.get_rate_limiters(url)
         )
         
         self.downloads[url] = {
@@ -455,7 +2965,14 @@ class DownloadManager:
             "speed": 0,
             "status": "paused" if start_byte > 0 else "queued",
             "start_time": time.time(),
-            "db_id": db_id
+            "db_id": db_id,
+            "progress_callback": progress_callback,
+            "complete_callback": complete_callback,
+            "error_callback": error_callback,
+            "priority": PRIORITY_NORMAL,
+            "storage": storage,
+            "checksum": checksum,
+            "extract": extract
         }
         
         # Update database
@@ -464,8 +2981,79 @@ class DownloadManager:
         return url
         
     def start_download(self, url):
+        """Queue a download, the scheduler starts it as soon as a slot is free"""
+        if self.queue_download(url):
+            self.schedule()
+            
+    def queue_download(self, url):
+        """Mark a download as waiting for the scheduler, returns whether it was"""
+        if url not in self.downloads:
+            return False
+            
+        download = self.downloads[url]
+        if download["status"] == "probing":
+            download["start_requested"] = True  # Queued once the probe has created it
+            return False
+        if download["status"] not in ["queued", "paused", "error"]:
+            return False
+            
+        with self.schedule_lock:
+            self.queue_counter += 1
+            download["queue_order"] = self.queue_counter
+            download["scheduled"] = True
+            if download["status"] != "queued":
+                download["status"] = "queued"
+                self.save_state(download, "queued")
+        logger.info(f"Queued download: {url}")
+        return True
+        
+    def schedule(self):
+        """Start waiting downloads in priority order while global and per-host slots are free"""
+        with self.schedule_lock:
+            downloads = list(self.downloads.items())
+            active_hosts = [urlparse(url).hostname for url, download in downloads
+                            if download["status"] == "downloading"]
+            waiting = sorted(
+                (url for url, download in downloads if download.get("scheduled") and download["status"] == "queued"),
+                key=lambda url: (self.downloads[url].get("priority", PRIORITY_NORMAL), self.downloads[url]["queue_order"])
+            )
+            
+            for url in waiting:
+                if len(active_hosts) >= self.config["max_active_downloads"]:
+                    break
+                host = urlparse(url).hostname
+                if active_hosts.count(host) >= self.config["max_downloads_per_host"]:
+                    continue
+                self.downloads[url]["scheduled"] = False
+                self.run_download(url)
+                if self.downloads[url]["status"] == "downloading":
+                    active_hosts.append(host)
+                
+    def set_priority(self, url, priority):
+        if url in self.downloads:
+            download = self.downloads[url]
+            download["priority"] = priority
+            self.db.set_priority(download["db_id"], priority)
+            logger.info(f"Set priority of {url} to {priority}")
+            self.schedule()
+            
+    def run_download(self, url):
         if url in self.downloads:
             download = self.downloads[url]
+            
+            # The first transfer to open the file claims the disk space, so a
+            # full disk fails right away instead of at 97%
+            part_file = self.get_part_file(download["temp_path"])
+            part_file.size = download["size"]
+            # Watchers restored with the download start at 0, what an earlier
+            # session wrote is caught up on, by the hasher in the background
+            if os.path.exists(download["temp_path"]):
+                for watcher in part_file.watchers:
+                    watcher.seed(self.get_contiguous_bytes(download))
+                
+            if "threads" in download:
+                self.start_multi_threaded_download(url)
+                return
             if download["status"] in ["queued", "paused", "error"]:
                 # If thread was stopped, create a new one
                 if download["thread"].is_stopped() or not download["thread"].is_alive():
@@ -478,9 +3066,755 @@ class DownloadManager:
                     download["thread"].resume()
                 
                 # Update database
-                self.db.update_download_progress(download["db_id"], download["downloaded"], download["size"], "downloading")
+                self.save_state(download, "downloading")
                 logger.info(f"Started download: {url}")
     
+    def create_multi_threaded_download(self, url, file_name=None, progress_callback=None,
+                                       complete_callback=None, error_callback=None, num_threads=None,
+                                       storage=None, checksum=None, extract=False, mirrors=None):
+        """Add a segmented download of url, returns its key.
+        
+        mirrors are other URLs of the same file, segments are spread over
+        the ones whose size and ETag match url.
+        """
+        if checksum:
+            checksum = parse_checksum(checksum)  # Reject a bad checksum before anything is stored
+        if num_threads is None:
+            num_threads = self.config["threads_per_download"]
+        if not file_name:
+            file_name = os.path.basename(urlparse(url).path) or "download"
+            
+        info, duplicate = self.probe_new_download(url, checksum)
+        if duplicate:
+            return self.create_linked_download(url, file_name, duplicate, complete_callback, extract)
+        file_size, accepts_ranges = info["size"], info["accepts_ranges"]
+            
+        if (not accepts_ranges or (num_threads < 2 and self.config["connection_tuning"] != "auto")
+                or file_size < 2 * self.config["min_segment_size"]):
+            # Nothing to split, fall back to a single stream
+            logger.info(f"Using a single connection for {url}" + (", ignoring its mirrors" if mirrors else ""))
+            return self.create_download(url, file_name, progress_callback, complete_callback, error_callback,
+                                        storage, checksum, extract)
+            
+        file_path = os.path.join(self.config["save_path"], file_name)
+        mirrors = self.verify_mirrors(url, info, mirrors) if mirrors else {}
+        
+        # Check for existing partial download
+        db_id, ranges = self.get_resume_ranges(url, file_name, file_size, info)
+        
+        # Add to database
+        if db_id is None:
+            db_id = self.db.add_download(url, file_name, self.config["save_path"])
+            logger.info(f"Added download to database with ID: {db_id}")
+        self.save_validators(db_id, info)
+        self.db.set_mirrors(db_id, mirrors)
+        storage = self.init_storage(db_id, file_path + ".part", storage)
+        checksum = self.init_checksum(db_id, file_path + ".part", checksum)
+        extract = self.init_extraction(url, db_id, file_path, file_size, extract)
+        
+        self.add_segmented_download(url, file_path, file_size, db_id, ranges, num_threads,
+                                    progress_callback, complete_callback, error_callback, mirrors=mirrors)
+        download = self.downloads[url]
+        download["storage"] = storage
+        download["checksum"] = checksum
+        download["extract"] = extract
+        if download["downloaded"] > 0:
+            download["status"] = "paused"
+            logger.info(f"Resuming download with {download['downloaded']} bytes already on disk")
+        
+        # Update database
+        self.save_state(download, "queued")
+        
+        return url
+        
+    def add_download_async(self, url, file_name=None, progress_callback=None, complete_callback=None,
+                           error_callback=None, num_threads=None, storage=None, checksum=None, extract=False,
+                           start=False, mirrors=None):
+        """Add a download without waiting for the server, returns its key at once.
+        
+        The download shows as "probing" while a background thread probes the
+        URL and creates it. With start, or if it is started meanwhile, it is
+        queued as soon as it exists.
+        """
+        if checksum:
+            checksum = parse_checksum(checksum)  # Reject a bad checksum while the caller can still show it
+        if not file_name:
+            file_name = os.path.basename(urlparse(url).path) or "download"
+        placeholder = self.add_placeholder(url, file_name, error_callback, start)
+        threading.Thread(
+            target=self.finish_probe, daemon=True,
+            args=(url, placeholder, file_name, progress_callback, complete_callback, error_callback,
+                  num_threads, storage, checksum, extract, mirrors)
+        ).start()
+        return url
+        
+    def add_placeholder(self, url, file_name, error_callback=None, start=False):
+        """Record that stands in for a download while its URL is probed"""
+        file_path = os.path.join(self.config["save_path"], file_name)
+        placeholder = {
+            "threads": [],
+            "file_path": file_path,
+            "temp_path": file_path + ".part",
+            "size": 0,
+            "downloaded": 0,
+            "speed": 0,
+            "status": "probing",
+            "start_time": time.time(),
+            "db_id": None,
+            "error_callback": error_callback,
+            "priority": PRIORITY_NORMAL,
+            "start_requested": start
+        }
+        self.downloads[url] = placeholder
+        return placeholder
+        
+    def finish_probe(self, url, placeholder, file_name, progress_callback, complete_callback, error_callback,
+                     num_threads, storage, checksum, extract, mirrors=None):
+        # Fills the probe cache, creating the download reads it from there. The
+        # response is only parked when the download is meant to start at once
+        self.probe_url(url, keep=placeholder["start_requested"])
+        if self.downloads.get(url) is not placeholder:
+            return  # Removed or added again while it was probed
+        try:
+            self.create_multi_threaded_download(url, file_name, progress_callback, complete_callback,
+                                                error_callback, num_threads, storage, checksum, extract, mirrors)
+        except Exception as e:
+            logger.error(f"Error adding {url}: {str(e)}")
+            placeholder["status"] = "error"
+            if error_callback:
+                error_callback(str(e))
+            return
+        if placeholder["start_requested"]:
+            self.start_download(url)
+        if self.downloads.get(url, {}).get("status") != "downloading":
+            self.close_probe_response(url)  # Queued, it must not hold a connection of the host meanwhile
+            
+    def add_downloads(self, urls, progress_callback=None, complete_callback=None, error_callback=None,
+                      num_threads=None, storage=None, extract=False, start=False):
+        """Add many URLs at once, returns the keys of the downloads added.
+        
+        Like add_download_async for a whole list: every URL shows as
+        "probing" right away, repeated URLs and URLs already in the list are
+        skipped. The callbacks get the URL as their first argument.
+        """
+        taken = {download["file_path"] for download in self.downloads.values()}
+        added = []
+        for url in dict.fromkeys(url.strip() for url in urls):
+            if not url or url in self.downloads:
+                continue
+            file_name = self.unique_file_name(os.path.basename(urlparse(url).path) or "download", taken)
+            bound_error_callback = (lambda error, url=url: error_callback(url, error)) if error_callback else None
+            added.append((url, self.add_placeholder(url, file_name, bound_error_callback, start)))
+        if added:
+            logger.info(f"Adding {len(added)} downloads")
+            threading.Thread(
+                target=self.finish_bulk_probe, daemon=True,
+                args=(added, progress_callback, complete_callback, num_threads, storage, extract)
+            ).start()
+        return [url for url, placeholder in added]
+        
+    def unique_file_name(self, file_name, taken):
+        """file_name, numbered if another download already saves to that path"""
+        base, ext = os.path.splitext(file_name)
+        candidate, number = file_name, 1
+        while os.path.join(self.config["save_path"], candidate) in taken:
+            number += 1
+            candidate = f"{base} ({number}){ext}"
+        taken.add(os.path.join(self.config["save_path"], candidate))
+        return candidate
+        
+    def finish_bulk_probe(self, added, progress_callback, complete_callback, num_threads, storage, extract):
+        """Probe the URLs of add_downloads on a worker pool and create their downloads.
+        
+        Downloads that start from scratch on a server with range support get
+        their database rows in a single transaction. The rest (resumes, files
+        to reuse, unknown sizes) go through create_multi_threaded_download.
+        """
+        if num_threads is None:
+            num_threads = self.config["threads_per_download"]
+        storage = storage or self.config["storage_backend"]
+        
+        def probe(url, placeholder):
+            info, duplicate = self.probe_new_download(url)
+            previous = self.db.find_unfinished_download(url, os.path.basename(placeholder["file_path"]),
+                                                        self.config["save_path"])
+            return info, duplicate, previous
+            
+        with concurrent.futures.ThreadPoolExecutor(self.config["probe_workers"]) as executor:
+            results = list(executor.map(lambda item: probe(*item), added))
+            
+        rows, fresh, started = [], [], []
+        for (url, placeholder), (info, duplicate, previous) in zip(added, results):
+            if self.downloads.get(url) is not placeholder:
+                continue  # Removed while it was probed
+            file_name = os.path.basename(placeholder["file_path"])
+            callbacks = (
+                (lambda downloaded, speed, url=url: progress_callback(url, downloaded, speed)) if progress_callback else None,
+                complete_callback,  # Already called with the URL
+                placeholder["error_callback"]
+            )
+            if duplicate or previous or not info["accepts_ranges"] or info["size"] <= 0:
+                try:
+                    self.create_multi_threaded_download(url, file_name, *callbacks, num_threads=num_threads,
+                                                        storage=storage, extract=extract)
+                except Exception as e:
+                    logger.error(f"Error adding {url}: {str(e)}")
+                    placeholder["status"] = "error"
+                    if placeholder["error_callback"]:
+                        placeholder["error_callback"](str(e))
+                    continue
+            else:
+                archive = extract and archive_type(file_name) is not None
+                rows.append((url, file_name, self.config["save_path"], info["size"], info["etag"],
+                             info["last_modified"], storage, int(archive)))
+                fresh.append((url, placeholder, info["size"], callbacks))
+            if placeholder["start_requested"]:
+                started.append(url)
+                
+        for db_id, (url, placeholder, file_size, callbacks) in zip(self.db.add_downloads(rows), fresh):
+            file_path = placeholder["file_path"]
+            self.get_part_file(file_path + ".part", storage)
+            self.add_segmented_download(url, file_path, file_size, db_id, [(0, file_size - 1)], num_threads,
+                                        *callbacks)
+            download = self.downloads[url]
+            download["storage"] = storage
+            download["checksum"] = None
+            download["extract"] = self.init_extraction(url, db_id, file_path, file_size)
+            self.db.queue_segments(db_id, self.get_segment_map(download))
+        logger.info(f"Created {len(rows)} new downloads in one transaction, "
+                    f"{len(added) - len(rows)} individually")
+        self.start_downloads(started)
+        
+    def add_segmented_download(self, url, file_path, file_size, db_id, ranges, num_threads,
+                               progress_callback=None, complete_callback=None, error_callback=None,
+                               status="queued", mirrors=None):
+        """Create the download record and one thread per missing byte range"""
+        auto = self.config["connection_tuning"] == "auto" and status != "completed"
+        if auto:
+            num_threads = AUTO_START_CONNECTIONS  # The tuner adds more while they help
+        self.downloads[url] = {
+            "threads": [],
+            "file_path": file_path,
+            "temp_path": file_path + ".part",
+            "size": file_size,
+            "downloaded": file_size - sum(end - start + 1 for start, end in ranges),
+            "speed": 0,
+            "status": status,
+            "start_time": time.time(),
+            "db_id": db_id,
+            "progress_callback": progress_callback,
+            "complete_callback": complete_callback,
+            "error_callback": error_callback,
+            "lock": threading.Lock(),
+            "priority": PRIORITY_NORMAL,
+            "mirrors": mirrors or {},  # Other URLs of the file -> (etag, last_modified)
+            "failed_mirrors": {}  # URL -> when it last failed or stalled
+        }
+        
+        for segment_start, segment_end in self.calculate_segments(ranges, num_threads):
+            self.downloads[url]["threads"].append(
+                self.create_segment_thread(url, segment_start, segment_end)
+            )
+        logger.info(f"Split {url} into {len(self.downloads[url]['threads'])} segments")
+        if auto:
+            self.downloads[url]["tuner"] = ConnectionTuner(len(self.downloads[url]["threads"]),
+                                                           self.downloads[url]["downloaded"])
+            self.downloads[url]["parked"] = set()  # Paused by the tuner, their ranges are left to the others
+        
+    def save_validators(self, db_id, info):
+        """Remember which version of the remote file the download fetches"""
+        if info["etag"] or info["last_modified"]:
+            self.db.set_validators(db_id, info["etag"], info["last_modified"])
+            
+    def validators_changed(self, validators, info):
+        """Whether the probed file differs from the one the stored (etag, last_modified) describe"""
+        etag, last_modified = validators
+        if etag and info["etag"]:
+            return etag != info["etag"]
+        if last_modified and info["last_modified"]:
+            return last_modified != info["last_modified"]
+        return False  # Nothing to compare, trust the size check
+        
+    def verify_mirrors(self, url, info, mirrors):
+        """Probe the mirrors of url in parallel, returns {mirror: (etag, last_modified)} of those serving the same file"""
+        mirrors = [mirror for mirror in dict.fromkeys(mirrors) if mirror != url]
+        with concurrent.futures.ThreadPoolExecutor(self.config["probe_workers"]) as executor:
+            results = list(executor.map(self.probe_url, mirrors))
+            
+        verified = {}
+        for mirror, mirror_info in zip(mirrors, results):
+            if mirror_info["size"] != info["size"] or not mirror_info["accepts_ranges"]:
+                logger.warning(f"Ignoring mirror {mirror}: size {mirror_info['size']} "
+                               f"(ranges: {mirror_info['accepts_ranges']}), expected {info['size']}")
+            elif info["etag"] and mirror_info["etag"] and info["etag"] != mirror_info["etag"]:
+                logger.warning(f"Ignoring mirror {mirror}: ETag {mirror_info['etag']} differs from {info['etag']}")
+            else:
+                verified[mirror] = (mirror_info["etag"], mirror_info["last_modified"])
+        logger.info(f"Using {len(verified)} of {len(mirrors)} mirrors for {url}")
+        return verified
+        
+    def discard_part_file(self, path):
+        self.part_files.pop(path, None)
+        if os.path.exists(path):
+            os.remove(path)
+            
+    def on_remote_changed(self, url):
+        """A transfer found the file changed on the server, start the download over"""
+        download = self.downloads.get(url)
+        if download is None:
+            return
+        with self.schedule_lock:
+            if download.get("restarting"):
+                return  # Another transfer noticed first
+            download["restarting"] = True
+        self.probe_cache.invalidate(url)  # The cached size and validators are out of date
+        # Called from a transfer, which has to finish before its data can go
+        threading.Thread(target=self.restart_download, args=(url, download), daemon=True).start()
+        
+    def restart_download(self, url, download):
+        """Drop the stale .part data of a download and add it again from scratch"""
+        transfers = self.get_download_threads(download)
+        for transfer in transfers:
+            transfer.stop()
+        deadline = time.time() + self.config["timeout"]
+        while any(transfer.is_alive() for transfer in transfers) and time.time() < deadline:
+            time.sleep(0.05)
+            
+        self.stop_extraction(url)
+        self.discard_part_file(download["temp_path"])
+        self.db.queue_segments(download["db_id"], [])
+        self.db.update_download_progress(download["db_id"], 0, download["size"], "queued")
+        logger.info(f"Discarded stale data of {url}, downloading it again")
+        
+        try:
+            key = self.create_multi_threaded_download(
+                url, os.path.basename(download["file_path"]),
+                download.get("progress_callback"), download.get("complete_callback"), download.get("error_callback"),
+                storage=download.get("storage"), checksum=download.get("checksum"),
+                extract=download.get("extract", False), mirrors=list(download.get("mirrors") or [])
+            )
+        except Exception as e:
+            self.downloads[url] = download
+            download["restarting"] = False
+            self.on_download_error(url, str(e))
+            return
+        self.set_priority(key, download.get("priority", PRIORITY_NORMAL))
+        if download.get("speed_limit") is not None:
+            self.set_speed_limit(key, download["speed_limit"])
+        self.start_download(key)
+        
+    def get_resume_ranges(self, url, file_name, file_size, info=None):
+        """Find what is left of an earlier attempt at this file.
+        
+        Returns (db_id, ranges) where db_id is the unfinished database row to
+        reuse (or None) and ranges are the (start, end) byte ranges still missing.
+        info is the probe result, its validators tell whether the file changed.
+        """
+        temp_file_path = os.path.join(self.config["save_path"], file_name) + ".part"
+        full_range = [(0, file_size - 1)] if file_size > 0 else []
+        
+        previous = self.db.find_unfinished_download(url, file_name, self.config["save_path"])
+        if previous:
+            db_id, total_size, downloaded = previous
+            if not os.path.exists(temp_file_path) or file_size <= 0:
+                return db_id, full_range
+            if total_size != file_size:
+                # The remote file changed size, the old data must not end up in the new file
+                self.discard_part_file(temp_file_path)
+                return db_id, full_range
+            if info and self.validators_changed(self.db.get_validators(db_id), info):
+                logger.info(f"{url} changed since it was partly downloaded, starting over")
+                self.discard_part_file(temp_file_path)
+                return db_id, full_range
+            segments = self.db.get_segments(db_id)
+            if segments:
+                return db_id, [(position, end_byte) for start_byte, end_byte, position in segments
+                               if position <= end_byte]
+            return db_id, [(downloaded, file_size - 1)] if downloaded < file_size else []
+            
+        if os.path.exists(temp_file_path) and file_size > 0:
+            # Partial file without a database row, it can only be a single stream.
+            # A full-size one was preallocated, so its length says nothing
+            start_byte = os.path.getsize(temp_file_path)
+            if start_byte > file_size:
+                self.discard_part_file(temp_file_path)
+            return None, [(start_byte, file_size - 1)] if start_byte < file_size else full_range
+            
+        return None, full_range
+        
+    def calculate_segments(self, ranges, num_threads):
+        """Split the missing (start, end) ranges into up to num_threads segments"""
+        min_segment_size = self.config["min_segment_size"]
+        segments = sorted(ranges)
+        while len(segments) < num_threads:
+            # Halve the largest range as long as both halves stay big enough
+            largest = max(segments, key=lambda r: r[1] - r[0], default=None)
+            if largest is None or largest[1] - largest[0] + 1 < 2 * min_segment_size:
+                break
+            middle = largest[0] + (largest[1] - largest[0] + 1) // 2
+            index = segments.index(largest)
+            segments[index:index + 1] = [(largest[0], middle - 1), (middle, largest[1])]
+        return segments
+        
+    def create_segment_thread(self, url, start_byte, end_byte):
+        download = self.downloads[url]
+        # Segment threads report to the manager, which aggregates and persists progress
+        thread = self.new_transfer(
+            url, download["temp_path"], start_byte, end_byte,
+            lambda downloaded, speed: self.update_multi_progress(url),
+            lambda avg_speed: self.on_segment_complete(url),
+            lambda error: self.on_segment_error(url, error, thread),
+            self.build_headers(download["db_id"]),
+            self.config["timeout"],
+            None,
+            None,
+            self.config["chunk_size"],
+            lambda thread: self.steal_segment(url, thread),
+            pool=self.pool,
+            rate_limiters=self.get_rate_limiters(url),
+            changed_callback=lambda error: self.on_segment_changed(url, thread, error)
+        )
+        if download.get("mirrors"):
+            mirror = self.pick_mirror(url)
+            thread.use_mirror(mirror, self.mirror_headers(download, mirror))
+        thread.address = self.pick_address(url)
+        return thread
+        
+    def pick_address(self, url, thread=None):
+        """Host address a segment of url connects to, None if the host has just one.
+        
+        New segments are spread so every address gets a connection before
+        any gets two. A thread asking for a new range moves to the address
+        whose connections are fastest on average, its own speed counting for
+        the address it is on, so segments drift towards the better paths.
+        """
+        if self.downloads[url].get("mirrors"):
+            return None  # Segments are spread over the mirrors instead
+        parsed = urlparse(url)
+        # Known from the probe or earlier connections, restored downloads pick up addresses as they connect
+        addresses = self.resolver.cached_addresses(parsed.hostname,
+                                                   parsed.port or (443 if parsed.scheme == "https" else 80))
+        addresses = [address for address in addresses if not self.resolver.is_failing(address)] or addresses
+        if len(addresses) < 2:
+            return None
+        return self.pick_fastest(self.downloads[url], addresses, lambda other: other.address, thread)
+        
+    def pick_mirror(self, url, thread=None):
+        """URL a segment of url fetches from, url itself or one of its mirrors.
+        
+        Chosen like pick_address: new segments go to the least used mirror,
+        a thread asking for a new range moves to the fastest one. Faster
+        mirrors finish their ranges sooner and take over more of the others
+        through steal_segment, so each gets a share of the file in proportion
+        to its throughput. Mirrors that failed or stalled lately are avoided.
+        """
+        download = self.downloads[url]
+        mirrors = [url] + list(download["mirrors"])
+        healthy = self.healthy_mirrors(url, download) or mirrors
+        return self.pick_fastest(download, healthy, lambda other: other.url, thread)
+        
+    def pick_fastest(self, download, candidates, current, thread=None):
+        """Balance the segments of a download over candidates, current(thread) tells where a thread is"""
+        speeds = {candidate: [] for candidate in candidates}
+        for other in download.get("threads", []):
+            if current(other) in speeds and not other.is_stopped() and (other is thread or not other.completed):
+                speeds[current(other)].append(other.range_speed())
+        if thread is None:
+            return min(candidates, key=lambda candidate: len(speeds[candidate]))
+        measured = [candidate for candidate in candidates if speeds[candidate]]
+        if not measured:
+            return current(thread) if current(thread) in speeds else candidates[0]
+        return max(measured, key=lambda candidate: sum(speeds[candidate]) / len(speeds[candidate]))
+        
+    def healthy_mirrors(self, url, download):
+        """url and its mirrors, without those that failed or stalled lately"""
+        now = time.time()
+        return [mirror for mirror in [url] + list(download["mirrors"])
+                if now - download["failed_mirrors"].get(mirror, 0) >= MIRROR_RETRY_DELAY]
+        
+    def mirror_headers(self, download, mirror):
+        """Request headers for mirror, If-Range carries the validators that mirror reported"""
+        if mirror in download["mirrors"]:
+            return self.build_headers(validators=download["mirrors"][mirror])
+        return self.build_headers(download["db_id"])
+        
+    def get_mirror_stats(self, url):
+        """{mirror: (connections, bytes per second, failed)} of a download with mirrors"""
+        download = self.downloads.get(url)
+        if not download or not download.get("mirrors"):
+            return {}
+        healthy = self.healthy_mirrors(url, download)
+        stats = {mirror: (0, 0, mirror not in healthy) for mirror in [url] + list(download["mirrors"])}
+        for thread in download["threads"]:
+            if thread.url in stats and thread.is_alive() and not thread.completed and not thread.is_stopped():
+                connections, speed, failed = stats[thread.url]
+                stats[thread.url] = (connections + 1, speed + thread.speed, failed)
+        return stats
+        
+    def fail_mirror(self, url, thread, reason):
+        """Avoid the mirror of thread for a while and continue its range from another one.
+        
+        Returns False if no other mirror is healthy, the range then stays
+        with the thread.
+        """
+        download = self.downloads.get(url)
+        if download is None or not download.get("mirrors"):
+            return False
+        with download["lock"]:
+            download["failed_mirrors"][thread.url] = time.time()
+            if not self.healthy_mirrors(url, download):
+                logger.warning(f"{thread.url} failed ({reason}) and no other mirror of {url} is left")
+                return False
+            logger.warning(f"Moving a segment of {url} off {thread.url}: {reason}")
+            if download["status"] != "downloading":
+                return True  # The range is picked up from a healthy mirror on the next start
+            remaining = thread.give_up_range()
+            if remaining:
+                new_thread = self.create_segment_thread(url, *remaining)
+                new_thread.retry_count = thread.retry_count
+                new_thread.refetched_bytes = thread.refetched_bytes
+                new_thread.start()
+                download["threads"].append(new_thread)
+        if not remaining:
+            self.on_segment_complete(url)  # It had just reached the end of its range
+        return True
+        
+    def check_stalled_mirrors(self, url, download):
+        """Move ranges off mirrors that sent nothing for mirror_stall_timeout seconds"""
+        for thread in list(download["threads"]):
+            if (thread.is_alive() and not thread.completed and not thread.is_stopped() and not thread.is_paused()
+                    and thread.remaining_bytes() and thread.idle_time() > self.config["mirror_stall_timeout"]):
+                self.fail_mirror(url, thread, f"no data for {thread.idle_time():.0f}s")
+                
+    def on_segment_changed(self, url, thread, error):
+        """A segment found its file changed on the server, a mirror is just dropped if others are left"""
+        if thread.url != url and self.fail_mirror(url, thread, "the file changed"):
+            return
+        self.on_remote_changed(url)
+        
+    def get_address_stats(self, url):
+        """{address: (connections, bytes per second)} of a download spread over several addresses"""
+        stats = {}
+        download = self.downloads.get(url)
+        for thread in self.get_download_threads(download) if download else []:
+            if thread.address and thread.is_alive() and not thread.completed:
+                connections, speed = stats.get(thread.address, (0, 0))
+                stats[thread.address] = (connections + 1, speed + thread.speed)
+        return stats
+        
+    def steal_segment(self, url, thread):
+        """Give a thread that finished its range half of the largest remaining one"""
+        if url not in self.downloads:
+            return False
+            
+        download = self.downloads[url]
+        with download["lock"]:
+            if download["status"] != "downloading":
+                return False
+            candidates = [t for t in download["threads"]
+                          if t is not thread and t.is_alive() and not t.completed
+                          and not t.is_stopped() and (not t.is_paused() or t in download.get("parked", ()))]
+            # Try the biggest first, a candidate may have moved on since we looked
+            for victim in sorted(candidates, key=lambda t: t.remaining_bytes(), reverse=True):
+                stolen = victim.split(self.config["min_segment_size"])
+                if stolen:
+                    # Measured on the range it just finished
+                    address = self.pick_address(url, thread)
+                    mirror = self.pick_mirror(url, thread) if download["mirrors"] else thread.url
+                    thread.assign_range(*stolen)
+                    thread.address = address
+                    if mirror != thread.url:
+                        thread.use_mirror(mirror, self.mirror_headers(download, mirror))
+                    logger.debug(f"Split segment for {url}: new range {stolen[0]}-{stolen[1]}")
+                    return True
+        return False
+        
+    def start_multi_threaded_download(self, url):
+        if url not in self.downloads:
+            return
+            
+        download = self.downloads[url]
+        if download["status"] not in ["queued", "paused", "error"]:
+            return
+            
+        with download["lock"]:
+            download["status"] = "downloading"
+            if download.get("parked"):
+                download["parked"].clear()  # Resumed with the rest, the tuner parks again what is too many
+            threads = []
+            for thread in download["threads"]:
+                if thread.completed:
+                    threads.append(thread)
+                elif thread.is_alive() and not thread.is_stopped():
+                    thread.resume()
+                    threads.append(thread)
+                elif thread.ident is None and not thread.is_stopped():
+                    thread.start()
+                    threads.append(thread)
+                elif thread.get_range()[2] <= thread.end_byte:
+                    # Thread was stopped or failed, continue its range in a new one from
+                    # what is on disk, bytes still buffered may never have been written
+                    start_byte, end_byte, position = thread.get_range()
+                    new_thread = self.create_segment_thread(url, position, end_byte)
+                    new_thread.retry_count = thread.retry_count
+                    new_thread.refetched_bytes = thread.refetched_bytes + thread.start_byte + thread.downloaded - position
+                    new_thread.start()
+                    threads.append(new_thread)
+            download["threads"] = threads
+            
+        # Update database
+        self.save_state(download, "downloading")
+        logger.info(f"Started multi-threaded download: {url} ({len(threads)} segments)")
+        
+        # Everything may already be on disk, from an earlier session or a
+        # run that failed verification, and then only the checks are left
+        if all(thread.completed for thread in threads):
+            self.on_segment_complete(url)
+        
+    def tune_connections(self, url, download):
+        """Let the tuner of an auto-tuned download pick its connection count, then park or add segments"""
+        # What the caps leave once every other download's connections are counted
+        host = urlparse(url).hostname
+        host_used = total_used = 0
+        for other_url, other in list(self.downloads.items()):
+            if other is download or other["status"] != "downloading":
+                continue
+            active = len(self.active_segments(other)) if "threads" in other else 1
+            total_used += active
+            if urlparse(other_url).hostname == host:
+                host_used += active
+        limit = max(1, min(self.config["max_connections"] - host_used,
+                           self.config["max_total_connections"] - total_used))
+        
+        retries = sum(thread.retry_count for thread in download["threads"])
+        target = download["tuner"].update(download["downloaded"], retries, limit)
+        
+        with download["lock"]:
+            if download["status"] != "downloading":
+                return
+            download["parked"].intersection_update(self.active_segments(download, parked=True))
+            active = self.active_segments(download)
+            # Park the slowest connections first, their ranges go to the others through steal_segment
+            for thread in sorted(active, key=lambda t: t.range_speed())[:max(0, len(active) - target)]:
+                thread.pause()
+                download["parked"].add(thread)
+                logger.debug(f"Parked a segment of {url}, {target} connections")
+            for _ in range(target - len(active)):
+                if download["parked"]:
+                    thread = download["parked"].pop()
+                    thread.resume()
+                    continue
+                candidates = [t for t in download["threads"] if t.is_alive() and not t.completed and not t.is_stopped()]
+                stolen = None
+                for victim in sorted(candidates, key=lambda t: t.remaining_bytes(), reverse=True):
+                    stolen = victim.split(self.config["min_segment_size"])
+                    if stolen:
+                        break
+                if not stolen:
+                    break  # Too little left to split
+                thread = self.create_segment_thread(url, *stolen)
+                thread.start()
+                download["threads"].append(thread)
+                logger.debug(f"Added a segment to {url}: {stolen[0]}-{stolen[1]}, {target} connections")
+                
+    def active_segments(self, download, parked=False):
+        """Segment transfers of a download that are moving data or trying to, the paused ones with parked"""
+        return [thread for thread in download["threads"]
+                if thread.is_alive() and not thread.completed and not thread.is_stopped()
+                and thread.is_paused() == parked]
+        
+    def get_connection_history(self, url):
+        """(time, connections, bytes per second, reason) steps of an auto-tuned download, None if it isn't"""
+        download = self.downloads.get(url)
+        tuner = download.get("tuner") if download else None
+        return list(tuner.history) if tuner else None
+        
+    def get_download_threads(self, download):
+        if "threads" in download:
+            return download["threads"]
+        return [download["thread"]]
+        
+    def get_retry_stats(self, url):
+        """(retries, bytes re-fetched) over all transfers of a download"""
+        threads = self.get_download_threads(self.downloads[url])
+        return sum(thread.retry_count for thread in threads), sum(thread.refetched_bytes for thread in threads)
+        
+    def get_segment_map(self, download):
+        return [thread.get_range() for thread in download["threads"]]
+        
+    def save_state(self, download, status):
+        """Persist progress, and the segment map if there is one, with a new status"""
+        if "threads" in download:
+            self.db.queue_segments(download["db_id"], self.get_segment_map(download))
+        self.db.update_download_progress(download["db_id"], self.get_contiguous_bytes(download), download["size"], status)
+        
+    def get_contiguous_bytes(self, download):
+        """Bytes from the start of the file that are on disk without gaps"""
+        if "threads" not in download:
+            return download["thread"].durable_position()
+        positions = [position for start_byte, end_byte, position in self.get_segment_map(download)
+                     if position <= end_byte]
+        return min(positions) if positions else download["size"]
+        
+    def update_multi_progress(self, url):
+        if url not in self.downloads:
+            return
+            
+        download = self.downloads[url]
+        threads = download["threads"]
+        download["downloaded"] = download["size"] - sum(t.remaining_bytes() for t in threads)
+        download["speed"] = sum(t.speed for t in threads if t.is_alive() and not t.completed and not t.is_paused())
+        
+        if download["progress_callback"]:
+            download["progress_callback"](download["downloaded"], download["speed"])
+            
+        self.queue_state(download)
+        
+    def queue_state(self, download):
+        """Queue progress and the segment map for the next batched write"""
+        # The stored offset is the gap-free prefix so a single-stream
+        # resume never skips missing bytes, the segment map has the rest
+        if "threads" in download:
+            self.db.queue_segments(download["db_id"], self.get_segment_map(download))
+        self.db.queue_progress(
+            download["db_id"], self.get_contiguous_bytes(download),
+            download["size"], download["speed"]
+        )
+                
+    def on_segment_complete(self, url):
+        if url not in self.downloads:
+            return
+            
+        download = self.downloads[url]
+        with download["lock"]:
+            # A thread that gave its range up to another mirror has nothing left to do
+            if download["status"] == "completed" or download.get("finishing") or not all(
+                    t.completed or (t.is_stopped() and not t.remaining_bytes()) for t in download["threads"]):
+                return
+            # Claimed by the last segment, the checks run outside the lock
+            download["finishing"] = True
+            avg_speed = sum(t.average_speed() for t in download["threads"])
+        self.finish_download(url, download["temp_path"], download["file_path"],
+                             download["complete_callback"], avg_speed)
+            
+    def on_segment_error(self, url, error, thread=None):
+        if url not in self.downloads:
+            return
+            
+        download = self.downloads[url]
+        if thread is not None and self.fail_mirror(url, thread, error):
+            return  # Another mirror carries on with the range
+        with download["lock"]:
+            if download["status"] == "error":
+                return
+            # One failed segment fails the whole download, stop the others
+            for thread in download["threads"]:
+                thread.stop()
+            self.on_download_error(url, error)
+            
+        if download["error_callback"]:
+            download["error_callback"](error)
+        
     def recreate_thread(self, url):
         if url not in self.downloads:
             return
@@ -488,27 +3822,32 @@ class DownloadManager:
         download = self.downloads[url]
         temp_file_path = download["temp_path"]
         
-        # Get current downloaded bytes
-        current_downloaded = os.path.getsize(temp_file_path) if os.path.exists(temp_file_path) else 0
+        # Continue from what the previous thread got on disk, unless the file is gone
+        previous = download["thread"]
+        current_downloaded = previous.durable_position() if os.path.exists(temp_file_path) else 0
         
         # Headers
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-        if self.config["proxy"]:
-            headers['Proxy'] = self.config["proxy"]
+        headers = self.build_headers(download["db_id"])
             
         # Create a new thread
-        thread = DownloadThread(
+        thread = self.new_transfer(
             url, temp_file_path, current_downloaded, download["size"] - 1,
             lambda downloaded, speed: self.update_progress(url, downloaded, speed),
-            lambda avg_speed: self.on_download_complete(url, temp_file_path, download["file_path"], None, avg_speed),
+            lambda avg_speed: self.finish_download(url, temp_file_path, download["file_path"], None, avg_speed),
             lambda error: self.on_download_error(url, error),
             headers,
             self.config["timeout"],
             download["db_id"],
             self.db,
-            self.config["chunk_size"]
+            self.config["chunk_size"],
+            pool=self.pool,
+            rate_limiters=self.get_rate_limiters(url)
         )
         
+        thread.retry_count = previous.retry_count
+        thread.refetched_bytes = previous.refetched_bytes
+        if current_downloaded:
+            thread.refetched_bytes += previous.start_byte + previous.downloaded - current_downloaded
         download["thread"] = thread
         download["downloaded"] = current_downloaded
         logger.info(f"Recreated thread for {url}")
@@ -516,21 +3855,19 @@ class DownloadManager:
     def pause_download(self, url):
         if url in self.downloads and self.downloads[url]["status"] == "downloading":
             self.downloads[url]["status"] = "paused"
-            self.downloads[url]["thread"].pause()
+            for thread in self.get_download_threads(self.downloads[url]):
+                thread.pause()
             
             # Update database
             download = self.downloads[url]
-            self.db.update_download_progress(download["db_id"], download["downloaded"], download["size"], "paused")
+            self.save_state(download, "paused")
             logger.info(f"Paused download: {url}")
+            self.schedule()
             
     def resume_download(self, url):
         if url in self.downloads and self.downloads[url]["status"] == "paused":
-            self.downloads[url]["status"] = "downloading"
-            self.downloads[url]["thread"].resume()
-            
-            # Update database
-            download = self.downloads[url]
-            self.db.update_download_progress(download["db_id"], download["downloaded"], download["size"], "downloading")
+            # Resuming goes through the scheduler like any other start
+            self.start_download(url)
             logger.info(f"Resumed download: {url}")
             
     def toggle_pause_resume(self, url):
@@ -545,41 +3882,217 @@ class DownloadManager:
             
     def stop_download(self, url):
         if url in self.downloads:
+            if self.downloads[url]["status"] == "probing":
+                self.downloads[url]["start_requested"] = False  # Nothing runs yet, just don't start it
+                return
             self.downloads[url]["status"] = "stopped"
-            self.downloads[url]["thread"].stop()
+            for thread in self.get_download_threads(self.downloads[url]):
+                thread.stop()
             
             # Update database
             download = self.downloads[url]
-            self.db.update_download_progress(download["db_id"], download["downloaded"], download["size"], "stopped")
+            self.save_state(download, "stopped")
             logger.info(f"Stopped download: {url}")
+            self.schedule()
             
     def remove_download(self, url):
         if url in self.downloads:
             if self.downloads[url]["status"] == "downloading":
                 self.stop_download(url)
+            self.part_files.pop(self.downloads[url]["temp_path"], None)
+            self.stop_extraction(url)
             del self.downloads[url]
+            self.download_limiters.pop(url, None)
             logger.info(f"Removed download: {url}")
+            self.schedule()
+            
+    def index_file(self, download, url, path):
+        """Remember a completed file so later downloads of the same content can link to it"""
+        etag, last_modified = self.db.get_validators(download["db_id"])
+        if not (etag or last_modified or download.get("checksum")):
+            return  # Nothing to tell a later copy of the file by
+        stat = os.stat(path)
+        self.db.index_file(url, etag, last_modified, stat.st_size, download.get("checksum"), path, stat.st_mtime)
+        
+    def get_index_entries(self, url, checksum=None):
+        """Index entries for url or checksum whose file is intact, the others are evicted"""
+        entries, stale = [], []
+        for entry in self.db.find_indexed_files(url, checksum):
+            index_id, indexed_url, etag, last_modified, size, indexed_checksum, path, mtime = entry
+            if self.is_intact(path, size, mtime):
+                entries.append(entry)
+            else:
+                stale.append(index_id)
+        if stale:
+            self.db.remove_indexed_files(stale)
+        return entries
+        
+    def probe_new_download(self, url, checksum=None):
+        """Probe a URL that is being added, returns (info, index entry of a file to reuse or None).
+        
+        A URL that was downloaded before is probed with If-None-Match and
+        If-Modified-Since, a 304 means the earlier file is still current.
+        """
+        entries = self.get_index_entries(url, checksum)
+        previous = None
+        for entry in entries:
+            index_id, indexed_url, etag, last_modified, size, indexed_checksum, path, mtime = entry
+            if indexed_url == url and (etag or last_modified) and (not checksum or indexed_checksum == checksum):
+                previous = entry
+                break
+                
+        # A fresh cached probe is compared against the index without asking the server
+        info = self.probe_cache.get(url)
+        if info is None:
+            headers = None
+            if previous:
+                headers = {}
+                if previous[2]:
+                    headers['If-None-Match'] = previous[2]
+                if previous[3]:
+                    headers['If-Modified-Since'] = previous[3]
+            info = self.probe_url(url, headers)
+            if info["not_modified"]:
+                logger.info(f"{url} has not changed since it was downloaded to {previous[6]}")
+                return info, previous
+        return info, self.find_duplicate(url, info, checksum, entries)
+        
+    def find_duplicate(self, url, info, checksum=None, entries=None):
+        """Index entry of a completed file with the same content, None if there is none.
+        
+        With an expected checksum only a file verified against the same
+        checksum counts. Otherwise the file must come from the same URL with
+        the same size and a matching strong ETag, or Last-Modified when the
+        server sends no ETag.
+        """
+        if entries is None:
+            entries = self.get_index_entries(url, checksum)
+        for entry in entries:
+            index_id, indexed_url, etag, last_modified, size, indexed_checksum, path, mtime = entry
+            if checksum:
+                if indexed_checksum == checksum:
+                    return entry
+            elif indexed_url == url and size == info["size"] and size > 0:
+                if info["etag"] and etag:
+                    if etag == info["etag"] and not etag.startswith("W/"):
+                        return entry
+                elif info["last_modified"] and last_modified == info["last_modified"]:
+                    return entry
+        return None
+        
+    def is_intact(self, path, size, mtime):
+        """Whether an indexed file is still there as it was indexed"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        return stat.st_size == size and stat.st_mtime == mtime
+        
+    def prune_file_index(self):
+        """Evict index entries whose file was deleted or changed"""
+        stale = [index_id for index_id, size, path, mtime in self.db.get_indexed_files()
+                 if not self.is_intact(path, size, mtime)]
+        if stale:
+            self.db.remove_indexed_files(stale)
+            logger.info(f"Evicted {len(stale)} files from the file index")
+            
+    def create_linked_download(self, url, file_name, duplicate, complete_callback=None, extract=False):
+        """Finish a download at once from an identical completed file"""
+        index_id, indexed_url, etag, last_modified, size, checksum, source, mtime = duplicate
+        file_path = os.path.join(self.config["save_path"], file_name)
+        self.link_file(source, file_path)
+        db_id = self.db.add_linked_download(url, file_name, self.config["save_path"], size)
+        self.add_segmented_download(url, file_path, size, db_id, [], 1, status="completed")
+        self.downloads[url]["checksum"] = checksum
+        self.downloads[url]["extract"] = self.init_extraction(url, db_id, file_path, size, extract, complete=True)
+        logger.info(f"Reused {source} for {url}, nothing to download")
+        
+        # The copy is indexed too, so it stays reusable if the source goes away
+        if os.path.abspath(file_path) != os.path.abspath(source):
+            self.db.index_file(url, etag, last_modified, size, checksum, file_path, os.stat(file_path).st_mtime)
+        if complete_callback:
+            complete_callback(url)
+        return url
+        
+    def link_file(self, source, target):
+        """Give target the content of source, a hardlink or clone where the filesystem allows"""
+        if os.path.exists(target) and os.path.samefile(source, target):
+            return
+        temp_path = target + ".link"
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        try:
+            os.link(source, temp_path)
+        except OSError:
+            # Another filesystem or no hardlink support, fall back to a clone or a copy
+            self.clone_file(source, temp_path)
+        os.replace(temp_path, target)
+        
+    def clone_file(self, source, target):
+        with open(source, "rb") as src, open(target, "wb") as dst:
+            if fcntl:
+                try:
+                    fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                    return
+                except OSError:
+                    pass  # No reflink support on this filesystem
+            shutil.copyfileobj(src, dst, HASH_READ_SIZE)
             
+    def finish_download(self, url, temp_path, final_path, complete_callback, avg_speed):
+        """Run on_download_complete on a thread of its own.
+        
+        Hashing what is left of the file, the rename and indexing can take
+        a while, and must hold up neither an event loop full of transfers
+        nor whoever calls in from the GUI.
+        """
+        threading.Thread(target=self.on_download_complete, daemon=True,
+                         args=(url, temp_path, final_path, complete_callback, avg_speed)).start()
+        
     def on_download_complete(self, url, temp_path, final_path, complete_callback, avg_speed):
         if url in self.downloads:
-            self.downloads[url]["status"] = "completed"
+            part_file = self.part_files.pop(temp_path, None)
+            
+            # The file keeps its .part name and its data until the hash matches
+            if self.downloads[url].get("checksum"):
+                self.downloads[url]["status"] = "verifying"
+                if not self.verify_checksum(self.downloads[url], part_file):
+                    self.stop_extraction(url)
+                    self.downloads[url]["finishing"] = False  # A restart verifies again
+                    error = "Checksum mismatch"
+                    self.on_download_error(url, error)
+                    if self.downloads[url].get("error_callback"):
+                        self.downloads[url]["error_callback"](error)
+                    return
+                    
+            if self.downloads[url]["size"] <= 0 and os.path.exists(temp_path):
+                self.downloads[url]["size"] = os.path.getsize(temp_path)  # The server never said
             self.downloads[url]["downloaded"] = self.downloads[url]["size"]
             
             # Rename temp file to final name
+            download = self.downloads[url]
             try:
                 if os.path.exists(temp_path):
-                    os.rename(temp_path, final_path)
+                    extractor = self.extractors.get(url)
+                    if extractor:
+                        # The extraction stage reads on from the renamed file
+                        extractor.source_moved(final_path, lambda: os.rename(temp_path, final_path))
+                    else:
+                        os.rename(temp_path, final_path)
                     logger.info(f"Download completed: {url} -> {final_path}")
+                    self.index_file(download, url, final_path)
             except Exception as e:
                 logger.error(f"Error renaming file: {str(e)}")
             
             # Update database
-            download = self.downloads[url]
             self.db.complete_download(download["db_id"], avg_speed)
+            # Only now, whoever sees "completed" finds the final file and its row
+            download["status"] = "completed"
                 
             if complete_callback:
                 complete_callback(url)
                 
+            self.schedule()
+                
     def on_download_error(self, url, error):
         if url in self.downloads:
             self.downloads[url]["status"] = "error"
@@ -587,7 +4100,8 @@ class DownloadManager:
             
             # Update database
             download = self.downloads[url]
-            self.db.update_download_progress(download["db_id"], download["downloaded"], download["size"], "error")
+            self.save_state(download, "error")
+            self.schedule()
                 
     def update_progress(self, url, downloaded, speed):
         if url in self.downloads:
@@ -599,28 +4113,60 @@ class DownloadManager:
         active_downloads = self.db.get_active_downloads()
         logger.info(f"Loading {len(active_downloads)} active downloads from database")
         
-        for download in active_downloads:
-            db_id, url, filename, total_size, downloaded, status = download
+        resume_urls = [download[1] for download in active_downloads if self.restore_download(*download)]
+        self.prune_file_index()
+        
+        # Auto-resume downloads that were in progress, one timer for all of them
+        if resume_urls:
+            # Start the downloads after a short delay to allow UI to initialize
+            threading.Timer(1.0, lambda: self.start_downloads(resume_urls)).start()
+            logger.info(f"Scheduled auto-resume for {len(resume_urls)} downloads")
             
-            file_path = os.path.join(self.config["save_path"], filename)
-            temp_file_path = file_path + ".part"
+    def start_downloads(self, urls):
+        # One scheduling pass for all of them
+        queued = [url for url in urls if self.queue_download(url)]
+        if queued:
+            self.schedule()
             
+    def restore_download(self, db_id, url, filename, total_size, downloaded, status):
+        """Recreate a download record from its database row, returns True if it should auto-resume"""
+        file_path = os.path.join(self.config["save_path"], filename)
+        temp_file_path = file_path + ".part"
+        storage = self.init_storage(db_id, temp_file_path, self.db.get_storage(db_id))
+        checksum = self.init_checksum(db_id, temp_file_path)
+        extract = self.init_extraction(url, db_id, file_path, total_size)
+        
+        segments = self.db.get_segments(db_id)
+        if segments:
+            # Segmented download, restart exactly the ranges that are still missing
+            if os.path.exists(temp_file_path):
+                ranges = [(position, end_byte) for start_byte, end_byte, position in segments
+                          if position <= end_byte]
+            else:
+                ranges = [(0, total_size - 1)]
+            self.add_segmented_download(url, file_path, total_size, db_id, ranges,
+                                        self.config["threads_per_download"], status=status,
+                                        mirrors=self.db.get_mirrors(db_id))
+        else:
+            if not os.path.exists(temp_file_path):
+                downloaded = 0
+                
             # Headers
-            headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-            if self.config["proxy"]:
-                headers['Proxy'] = self.config["proxy"]
+            headers = self.build_headers(db_id)
                 
             # Create download thread
-            thread = DownloadThread(
+            thread = self.new_transfer(
                 url, temp_file_path, downloaded, total_size - 1,
                 lambda downloaded, speed: self.update_progress(url, downloaded, speed),
-                lambda avg_speed: self.on_download_complete(url, temp_file_path, file_path, None, avg_speed),
+                lambda avg_speed: self.finish_download(url, temp_file_path, file_path, None, avg_speed),
                 lambda error: self.on_download_error(url, error),
                 headers,
                 self.config["timeout"],
                 db_id,
                 self.db,
-                self.config["chunk_size"]
+                self.config["chunk_size"],
+                pool=self.pool,
+                rate_limiters=self.get_rate_limiters(url)
             )
             
             self.downloads[url] = {
@@ -635,11 +4181,18 @@ class DownloadManager:
                 "db_id": db_id
             }
             
-            # Auto-resume downloads that were in progress
-            if status == "downloading":
-                # Start the download after a short delay to allow UI to initialize
-                threading.Timer(1.0, lambda: self.start_download(url)).start()
-                logger.info(f"Scheduled auto-resume for {url}")
+        self.downloads[url]["priority"] = self.db.get_priority(db_id)
+        self.downloads[url]["storage"] = storage
+        self.downloads[url]["checksum"] = checksum
+        self.downloads[url]["extract"] = extract
+        self.downloads[url]["speed_limit"] = self.db.get_speed_limit(db_id)
+        self.apply_speed_limits()
+        
+        # Downloads that were in progress restart from the queue
+        if status == "downloading":
+            self.downloads[url]["status"] = "queued"
+            return True
+        return False
 
 
 class ModernDownloader:
@@ -804,6 +4357,7 @@ class ModernDownloader:
         
     def quit_application(self, icon, item):
         logger.info("Quitting application from tray")
+        self.manager.shutdown()
         self.tray_icon.stop()
         self.root.destroy()
         
@@ -834,6 +4388,16 @@ class ModernDownloader:
         self.url_entry = ttk.Entry(url_frame, textvariable=self.url_var, width=50)
         self.url_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 5))
         
+        # Optional expected hash, "sha256:..." or a bare hex digest
+        ttk.Label(url_frame, text="Checksum:").pack(side=tk.LEFT, padx=(0, 5))
+        self.checksum_var = tk.StringVar()
+        self.checksum_entry = ttk.Entry(url_frame, textvariable=self.checksum_var, width=20)
+        self.checksum_entry.pack(side=tk.LEFT, padx=(0, 5))
+        
+        # Unpack archives while they download
+        self.extract_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(url_frame, text="Extract", variable=self.extract_var).pack(side=tk.LEFT, padx=(0, 5))
+        
         self.add_btn = ttk.Button(url_frame, text="Add Download", command=self.add_download, style="Accent.TButton")
         self.add_btn.pack(side=tk.RIGHT)
         
@@ -871,6 +4435,7 @@ class ModernDownloader:
         self.tree.tag_configure('downloading', foreground='blue')
         self.tree.tag_configure('paused', foreground='orange')
         self.tree.tag_configure('queued', foreground='gray')
+        self.tree.tag_configure('probing', foreground='gray')
         self.tree.tag_configure('stopped', foreground='darkred')
         
         # Bind selection event
@@ -892,6 +4457,14 @@ class ModernDownloader:
         self.remove_btn = ttk.Button(control_frame, text="Remove", command=self.remove_selected_downloads)
         self.remove_btn.pack(side=tk.LEFT)
         
+        # Priority of the selected downloads
+        self.priority_var = tk.StringVar(value="normal")
+        self.priority_combo = ttk.Combobox(control_frame, textvariable=self.priority_var,
+                                           values=list(PRIORITIES), state="readonly", width=8)
+        self.priority_combo.pack(side=tk.RIGHT)
+        self.priority_combo.bind("<<ComboboxSelected>>", self.set_selected_priority)
+        ttk.Label(control_frame, text="Priority:").pack(side=tk.RIGHT, padx=(0, 5))
+        
         # Create details frame on the right
         details_frame = ttk.LabelFrame(self.right_frame, text="Download Details")
         details_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
@@ -946,40 +4519,73 @@ class ModernDownloader:
             ), tags=(download["status"],))
             
     def add_download(self):
-        url = self.url_var.get().strip()
-        if not url:
+        # More URLs after the first are mirrors of the same file
+        urls = self.url_var.get().split()
+        if not urls:
             messagebox.showerror("Error", "Please enter a valid URL")
             return
+        url = urls[0]
             
         # Generate filename from URL
         file_name = os.path.basename(urlparse(url).path) or "download"
             
-        # Add to download manager
-        download_url = self.manager.create_download(
-            url, 
-            file_name,
-            lambda downloaded, speed: self.manager.update_progress(url, downloaded, speed),
-            lambda url: self.on_download_complete(url),
-            lambda error: self.on_download_error(url, error)
-        )
-        
-        # Add to treeview
-        size = self.manager.downloads[download_url]["size"]
-        size_str = self.format_size(size) if size > 0 else "Unknown"
+        # Add to download manager, the server is probed in the background
+        try:
+            download_url = self.manager.add_download_async(
+                url, 
+                file_name,
+                lambda downloaded, speed: self.manager.update_progress(url, downloaded, speed),
+                lambda url: self.on_download_complete(url),
+                lambda error: self.on_download_error(url, error),
+                num_threads=self.manager.config["threads_per_download"],
+                checksum=self.checksum_var.get().strip() or None,
+                extract=self.extract_var.get(),
+                mirrors=urls[1:]
+            )
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
         
+        # Add to treeview, update_ui fills in the size once the probe is done
+        if self.tree.exists(download_url):
+            self.tree.delete(download_url)
         self.tree.insert("", "end", iid=download_url, values=(
             file_name, 
-            size_str, 
+            "Unknown", 
             "0%", 
-            "Queued", 
+            "Probing", 
             "0 B/s"
-        ), tags=("queued",))
+        ), tags=("probing",))
         
         # Clear URL entry
         self.url_var.set("")
+        self.checksum_var.set("")
         
         logger.info(f"Added download: {url}")
         
+    def import_urls(self, urls, start=False):
+        """Add a list of URLs, probed in the background and shown in one go"""
+        keys = self.manager.add_downloads(
+            urls,
+            lambda url, downloaded, speed: self.manager.update_progress(url, downloaded, speed),
+            lambda url: self.on_download_complete(url),
+            lambda url, error: self.on_download_error(url, error),
+            num_threads=self.manager.config["threads_per_download"],
+            start=start
+        )
+        for url in keys:
+            if self.tree.exists(url):
+                self.tree.delete(url)
+            self.tree.insert("", "end", iid=url, values=(
+                os.path.basename(self.manager.downloads[url]["file_path"]), 
+                "Unknown", 
+                "0%", 
+                "Probing", 
+                "0 B/s"
+            ), tags=("probing",))
+        logger.info(f"Imported {len(keys)} downloads")
+        return keys
+        
     def get_progress_bar(self, percentage):
         # Removed ANSI coloring which doesn't work in Tkinter
         bar_length = 20
@@ -1035,6 +4641,16 @@ class ModernDownloader:
             self.update_details()
             self.update_pause_button_text()
             
+            # Show the priority of the first selected download
+            if selection[0] in self.manager.downloads:
+                priority = self.manager.downloads[selection[0]].get("priority", PRIORITY_NORMAL)
+                self.priority_var.set(PRIORITY_NAMES[priority])
+                
+    def set_selected_priority(self, event=None):
+        priority = PRIORITIES[self.priority_var.get()]
+        for url in self.selected_urls:
+            self.manager.set_priority(url, priority)
+            
     def update_details(self):
         if self.selected_urls and len(self.selected_urls) == 1:
             url = self.selected_urls[0]
@@ -1050,6 +4666,42 @@ class ModernDownloader:
                 details += f"Downloaded: {self.format_size(download['downloaded'])}\n"
                 details += f"Status: {download['status']}\n"
                 details += f"Speed: {self.format_speed(download['speed'])}\n"
+                details += f"Priority: {PRIORITY_NAMES[download.get('priority', PRIORITY_NORMAL)]}\n"
+                if download.get('checksum'):
+                    details += f"Checksum: {download['checksum']}\n"
+                
+                retries, refetched = self.manager.get_retry_stats(url)
+                if retries:
+                    details += f"Retries: {retries} ({self.format_size(refetched)} re-fetched)\n"
+                    
+                writer_stats = self.manager.get_writer_stats(url)
+                if writer_stats:
+                    details += (f"Write buffer: {self.format_size(writer_stats['buffered'])} / "
+                                f"{self.format_size(writer_stats['buffer_size'])}, "
+                                f"latency {writer_stats['write_latency'] * 1000:.0f} ms\n")
+                    
+                address_stats = self.manager.get_address_stats(url)
+                if address_stats:
+                    details += "Addresses: " + ", ".join(
+                        f"{address} x{connections} ({self.format_speed(speed)})"
+                        for address, (connections, speed) in address_stats.items()) + "\n"
+                    
+                history = self.manager.get_connection_history(url)
+                if history:
+                    details += f"Connections: {history[-1][1]} (auto: " + ", ".join(
+                        f"{connections} {reason}" for _, connections, rate, reason in history[-6:]) + ")\n"
+                    
+                mirror_stats = self.manager.get_mirror_stats(url)
+                if mirror_stats:
+                    details += "Mirrors: " + ", ".join(
+                        f"{urlparse(mirror).netloc} x{connections} ({self.format_speed(speed)})"
+                        + (" failing" if failed else "")
+                        for mirror, (connections, speed, failed) in mirror_stats.items()) + "\n"
+                    
+                extract_stats = self.manager.get_extract_stats(url)
+                if extract_stats:
+                    details += (f"Extraction: {extract_stats['status']} {extract_stats['progress'] * 100:.0f}% "
+                                f"({extract_stats['files']} files)\n")
                 
                 if download['status'] == 'completed':
                     elapsed = time.time() - download['start_time']
@@ -1153,7 +4805,7 @@ class ModernDownloader:
         # Create settings window
         settings_window = tk.Toplevel(self.root)
         settings_window.title("Download Settings")
-        settings_window.geometry("500x400")
+        settings_window.geometry("500x625")
         settings_window.resizable(False, False)
         settings_window.transient(self.root)
         settings_window.grab_set()
@@ -1191,40 +4843,97 @@ class ModernDownloader:
         connections_spin = ttk.Spinbox(settings_frame, from_=1, to=16, textvariable=connections_var, width=10)
         connections_spin.grid(row=1, column=1, sticky=tk.W, pady=5)
 
+        # Threads per download setting, a fixed count or tuned per download up to Max Connections
+        ttk.Label(settings_frame, text="Threads per Download:").grid(row=2, column=0, sticky=tk.W, pady=5)
+        threads_frame = ttk.Frame(settings_frame)
+        threads_frame.grid(row=2, column=1, sticky=tk.W, pady=5)
+        threads_var = tk.StringVar(value=str(self.manager.config["threads_per_download"]))
+        threads_spin = ttk.Spinbox(threads_frame, from_=1, to=16, textvariable=threads_var, width=10)
+        threads_spin.pack(side=tk.LEFT)
+        tuning_var = tk.StringVar(value=self.manager.config["connection_tuning"])
+        tuning_combo = ttk.Combobox(threads_frame, textvariable=tuning_var, 
+                                   values=["fixed", "auto"], state="readonly", width=8)
+        tuning_combo.pack(side=tk.LEFT, padx=(5, 0))
+
+        # Download engine setting
+        ttk.Label(settings_frame, text="Download Engine:").grid(row=3, column=0, sticky=tk.W, pady=5)
+        engine_var = tk.StringVar(value=self.manager.config["engine"])
+        engine_combo = ttk.Combobox(settings_frame, textvariable=engine_var, 
+                                   values=["threads", "asyncio"], state="readonly", width=10)
+        engine_combo.grid(row=3, column=1, sticky=tk.W, pady=5)
+        
+        # Storage backend setting, used for new downloads
+        ttk.Label(settings_frame, text="Storage Backend:").grid(row=4, column=0, sticky=tk.W, pady=5)
+        storage_var = tk.StringVar(value=self.manager.config["storage_backend"])
+        storage_combo = ttk.Combobox(settings_frame, textvariable=storage_var, 
+                                    values=["file", "mmap"], state="readonly", width=10)
+        storage_combo.grid(row=4, column=1, sticky=tk.W, pady=5)
+        
+        # Max active downloads setting
+        ttk.Label(settings_frame, text="Max Active Downloads:").grid(row=5, column=0, sticky=tk.W, pady=5)
+        active_var = tk.StringVar(value=str(self.manager.config["max_active_downloads"]))
+        active_spin = ttk.Spinbox(settings_frame, from_=1, to=32, textvariable=active_var, width=10)
+        active_spin.grid(row=5, column=1, sticky=tk.W, pady=5)
+        
+        # Max downloads per host setting
+        ttk.Label(settings_frame, text="Max Downloads per Host:").grid(row=6, column=0, sticky=tk.W, pady=5)
+        per_host_var = tk.StringVar(value=str(self.manager.config["max_downloads_per_host"]))
+        per_host_spin = ttk.Spinbox(settings_frame, from_=1, to=16, textvariable=per_host_var, width=10)
+        per_host_spin.grid(row=6, column=1, sticky=tk.W, pady=5)
+        
+        # Bandwidth limit settings
+        ttk.Label(settings_frame, text="Speed Limit (KB/s, 0 = off):").grid(row=7, column=0, sticky=tk.W, pady=5)
+        global_limit_var = tk.StringVar(value=str(self.manager.config["global_speed_limit"]))
+        global_limit_spin = ttk.Spinbox(settings_frame, from_=0, to=1048576, increment=64, textvariable=global_limit_var, width=10)
+        global_limit_spin.grid(row=7, column=1, sticky=tk.W, pady=5)
+        
+        ttk.Label(settings_frame, text="Per-Download Limit (KB/s):").grid(row=8, column=0, sticky=tk.W, pady=5)
+        download_limit_var = tk.StringVar(value=str(self.manager.config["download_speed_limit"]))
+        download_limit_spin = ttk.Spinbox(settings_frame, from_=0, to=1048576, increment=64, textvariable=download_limit_var, width=10)
+        download_limit_spin.grid(row=8, column=1, sticky=tk.W, pady=5)
+        
         # Chunk size setting
-        ttk.Label(settings_frame, text="Chunk Size:").grid(row=2, column=0, sticky=tk.W, pady=5)
+        ttk.Label(settings_frame, text="Chunk Size:").grid(row=9, column=0, sticky=tk.W, pady=5)
         chunk_var = tk.StringVar(value=str(self.manager.config["chunk_size"]))
         chunk_combo = ttk.Combobox(settings_frame, textvariable=chunk_var, 
                                   values=["AUTO", "1024", "2048", "4096", "8192", "16384", "32768", "65536", "131072"], 
                                   state="readonly", width=10)
-        chunk_combo.grid(row=2, column=1, sticky=tk.W, pady=5)
+        chunk_combo.grid(row=9, column=1, sticky=tk.W, pady=5)
         
         # Timeout setting
-        ttk.Label(settings_frame, text="Timeout (seconds):").grid(row=3, column=0, sticky=tk.W, pady=5)
+        ttk.Label(settings_frame, text="Timeout (seconds):").grid(row=10, column=0, sticky=tk.W, pady=5)
         timeout_var = tk.StringVar(value=str(self.manager.config["timeout"]))
         timeout_spin = ttk.Spinbox(settings_frame, from_=5, to=120, textvariable=timeout_var, width=10)
-        timeout_spin.grid(row=3, column=1, sticky=tk.W, pady=5)
+        timeout_spin.grid(row=10, column=1, sticky=tk.W, pady=5)
         
         # Proxy setting
-        ttk.Label(settings_frame, text="Proxy (optional):").grid(row=4, column=0, sticky=tk.W, pady=5)
+        ttk.Label(settings_frame, text="Proxy (optional):").grid(row=11, column=0, sticky=tk.W, pady=5)
         proxy_var = tk.StringVar(value=self.manager.config["proxy"] or "")
         proxy_entry = ttk.Entry(settings_frame, textvariable=proxy_var)
-        proxy_entry.grid(row=4, column=1, sticky=tk.EW, pady=5)
+        proxy_entry.grid(row=11, column=1, sticky=tk.EW, pady=5)
         
         # Theme setting
-        ttk.Label(settings_frame, text="Theme:").grid(row=5, column=0, sticky=tk.W, pady=5)
+        ttk.Label(settings_frame, text="Theme:").grid(row=12, column=0, sticky=tk.W, pady=5)
         theme_var = tk.StringVar(value=self.manager.config["theme"])
         theme_combo = ttk.Combobox(settings_frame, textvariable=theme_var, 
                                   values=["light", "dark"], state="readonly", width=10)
-        theme_combo.grid(row=5, column=1, sticky=tk.W, pady=5)
+        theme_combo.grid(row=12, column=1, sticky=tk.W, pady=5)
         
         # Buttons frame
         buttons_frame = ttk.Frame(settings_frame)
-        buttons_frame.grid(row=6, column=0, columnspan=2, pady=20)
+        buttons_frame.grid(row=13, column=0, columnspan=2, pady=20)
         
         def save_settings():
             self.manager.config["save_path"] = path_var.get()
             self.manager.config["max_connections"] = int(connections_var.get())
+            self.manager.config["threads_per_download"] = int(threads_var.get())
+            self.manager.config["connection_tuning"] = tuning_var.get()
+            self.manager.config["engine"] = engine_var.get()
+            self.manager.config["storage_backend"] = storage_var.get()
+            self.manager.config["max_active_downloads"] = int(active_var.get())
+            self.manager.config["max_downloads_per_host"] = int(per_host_var.get())
+            self.manager.config["global_speed_limit"] = int(global_limit_var.get())
+            self.manager.config["download_speed_limit"] = int(download_limit_var.get())
             
             # Handle AUTO chunk size
             chunk_val = chunk_var.get()
@@ -1238,6 +4947,8 @@ class ModernDownloader:
             self.manager.config["theme"] = theme_var.get()
             
             self.manager.save_config()
+            self.manager.apply_speed_limits()
+            self.manager.schedule()
             self.apply_theme(theme_var.get())
             settings_window.destroy()
             
@@ -1260,9 +4971,22 @@ def parse_arguments():
     parser = argparse.ArgumentParser(description='Free Download Manager')
     parser.add_argument('--silent', action='store_true', help='Start the application in silent mode (minimized to tray)')
     parser.add_argument('--debug', action='store_true', help='Enable debug logging')
+    parser.add_argument('--import', dest='import_file', metavar='FILE',
+                        help='Add the URLs listed in FILE, one per line ("-" reads them from stdin)')
+    parser.add_argument('--start', action='store_true', help='Start the imported downloads right away')
     return parser.parse_args()
 
 
+def read_url_list(path):
+    """URLs from a file or stdin, one per line, blank lines and # comments skipped"""
+    if path == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    return [line.strip() for line in lines if line.strip() and not line.strip().startswith("#")]
+
+
 # Creating TK Container
 if __name__ == "__main__":
     args = parse_arguments()
@@ -1274,6 +4998,8 @@ if __name__ == "__main__":
     
     root = tk.Tk()
     app = ModernDownloader(root, silent_mode=args.silent)
+    if args.import_file:
+        app.import_urls(read_url_list(args.import_file), start=args.start)
     
     # Start the tray icon in a separate thread
     def run_tray_icon():
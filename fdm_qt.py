@@ -3,6 +3,7 @@ fdm_qt.py - PySide6 GUI wrapper for existing DownloadManager in fdm.py
 """
 
 import sys, os, time, threading, math, queue
+from urllib.parse import urlparse
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QTreeWidget, QTreeWidgetItem,
     QVBoxLayout, QWidget, QToolBar, QLabel, QSplitter,
@@ -14,11 +15,14 @@ from PySide6.QtGui import QIcon, QFont, QAction, QColor, QBrush, QKeySequence
 from PySide6.QtCore import Qt, QTimer, QSize, QObject, Signal
 # Import the existing backend (DownloadManager) and translator
 try:
-    from fdm import DownloadManager, DownloadDB
+    from fdm import DownloadManager, DownloadDB, PRIORITIES, PRIORITY_NORMAL, archive_type
 except Exception as e:
     print("Failed to import DownloadManager from fdm.py:", e)
     DownloadManager = None
     DownloadDB = None
+    PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+    PRIORITY_NORMAL = 1
+    archive_type = lambda file_name: None
 
 try:
     from translator import Translator
@@ -145,6 +149,43 @@ class SettingsDialog(QDialog):
         self.threads_spin.setRange(1, 16)
         layout.addRow("Threads per Download:", self.threads_spin)
         
+        # Fixed count above, or tuned per download up to Max Connections
+        self.tuning_combo = QComboBox()
+        self.tuning_combo.addItems(["fixed", "auto"])
+        layout.addRow("Connection Count:", self.tuning_combo)
+        
+        # Download engine
+        self.engine_combo = QComboBox()
+        self.engine_combo.addItems(["threads", "asyncio"])
+        layout.addRow("Download Engine:", self.engine_combo)
+        
+        # Storage backend for new downloads
+        self.storage_combo = QComboBox()
+        self.storage_combo.addItems(["file", "mmap"])
+        layout.addRow("Storage Backend:", self.storage_combo)
+        
+        # Scheduler limits
+        self.active_spin = QSpinBox()
+        self.active_spin.setRange(1, 32)
+        layout.addRow("Max Active Downloads:", self.active_spin)
+        
+        self.per_host_spin = QSpinBox()
+        self.per_host_spin.setRange(1, 16)
+        layout.addRow("Max Downloads per Host:", self.per_host_spin)
+        
+        # Bandwidth limits, 0 means unlimited
+        self.global_limit_spin = QSpinBox()
+        self.global_limit_spin.setRange(0, 1048576)
+        self.global_limit_spin.setSingleStep(64)
+        self.global_limit_spin.setSuffix(" KB/s")
+        layout.addRow("Speed Limit (0 = off):", self.global_limit_spin)
+        
+        self.download_limit_spin = QSpinBox()
+        self.download_limit_spin.setRange(0, 1048576)
+        self.download_limit_spin.setSingleStep(64)
+        self.download_limit_spin.setSuffix(" KB/s")
+        layout.addRow("Per-Download Limit:", self.download_limit_spin)
+        
         # Buttons
         self.buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
         self.buttons.accepted.connect(self.accept)
@@ -174,6 +215,13 @@ class SettingsDialog(QDialog):
             self.theme_combo.setCurrentText(config.get("theme", "light"))
             self.language_combo.setCurrentText(config.get("language", "en"))
             self.threads_spin.setValue(config.get("threads_per_download", 4))
+            self.tuning_combo.setCurrentText(config.get("connection_tuning", "fixed"))
+            self.engine_combo.setCurrentText(config.get("engine", "threads"))
+            self.storage_combo.setCurrentText(config.get("storage_backend", "file"))
+            self.active_spin.setValue(config.get("max_active_downloads", 3))
+            self.per_host_spin.setValue(config.get("max_downloads_per_host", 2))
+            self.global_limit_spin.setValue(config.get("global_speed_limit", 0))
+            self.download_limit_spin.setValue(config.get("download_speed_limit", 0))
 
     def save_settings(self):
         if self.manager:
@@ -191,8 +239,17 @@ class SettingsDialog(QDialog):
             self.manager.config["theme"] = self.theme_combo.currentText()
             self.manager.config["language"] = self.language_combo.currentText()
             self.manager.config["threads_per_download"] = self.threads_spin.value()
+            self.manager.config["connection_tuning"] = self.tuning_combo.currentText()
+            self.manager.config["engine"] = self.engine_combo.currentText()
+            self.manager.config["storage_backend"] = self.storage_combo.currentText()
+            self.manager.config["max_active_downloads"] = self.active_spin.value()
+            self.manager.config["max_downloads_per_host"] = self.per_host_spin.value()
+            self.manager.config["global_speed_limit"] = self.global_limit_spin.value()
+            self.manager.config["download_speed_limit"] = self.download_limit_spin.value()
             
             self.manager.save_config()
+            self.manager.apply_speed_limits()
+            self.manager.schedule()
             
     def accept(self):
         self.save_settings()
@@ -422,6 +479,14 @@ class FDMQtMain(QMainWindow):
         self.lang_combo.currentTextChanged.connect(self.on_language_changed)
         toolbar.addWidget(QLabel("Language:"))
         toolbar.addWidget(self.lang_combo)
+        
+        # Priority selector for the selected downloads
+        self.priority_combo = QComboBox()
+        self.priority_combo.addItems(list(PRIORITIES))
+        self.priority_combo.setCurrentText("normal")
+        self.priority_combo.textActivated.connect(self.on_priority_changed)
+        toolbar.addWidget(QLabel("Priority:"))
+        toolbar.addWidget(self.priority_combo)
 
         # Layout
         central = QWidget()
@@ -593,6 +658,19 @@ class FDMQtMain(QMainWindow):
 
     def add_download_to_tree(self, url, download):
         """Add a download to the tree widget"""
+        item = self.create_tree_item(url, download)
+        self.tree.addTopLevelItem(item)
+        self.tree_items[url] = item
+
+    def add_downloads_to_tree(self, urls):
+        """Add many downloads to the tree widget in one batch"""
+        items = [self.create_tree_item(url, self.manager.downloads[url]) for url in urls]
+        self.tree.setUpdatesEnabled(False)
+        self.tree.addTopLevelItems(items)
+        self.tree.setUpdatesEnabled(True)
+        self.tree_items.update(zip(urls, items))
+
+    def create_tree_item(self, url, download):
         filename = os.path.basename(download["file_path"])
         size = download["size"]
         downloaded = download["downloaded"]
@@ -642,25 +720,43 @@ class FDMQtMain(QMainWindow):
                 item.setBackground(i, QBrush(QColor(230, 230, 230)))  # Light gray
                 item.setForeground(i, QBrush(QColor(0, 0, 0)))  # Black text
                 
-        self.tree.addTopLevelItem(item)
-        self.tree_items[url] = item
+        return item
 
     def on_add(self):
-        """Add a new download"""
-        url, ok = QInputDialog.getText(self, self.tr.t("add_url_title"), self.tr.t("add_url_prompt"))
+        """Add a new download, or many when several URLs are pasted"""
+        text, ok = QInputDialog.getMultiLineText(self, self.tr.t("add_url_title"), self.tr.t("add_urls_prompt"))
+        urls = [line.strip() for line in text.splitlines() if line.strip()] if ok else []
+        if len(urls) > 1:
+            self.add_many(urls)
+            return
+        # More URLs on the line after the first are mirrors of the same file
+        url, *mirrors = urls[0].split() if urls else [""]
         if ok and url:
+            # Optional expected hash, verified when the download completes
+            checksum, ok = QInputDialog.getText(self, self.tr.t("add_url_title"), self.tr.t("checksum_prompt"))
+            if not ok:
+                return
+            # Archives can be unpacked while they download
+            extract = False
+            if archive_type(os.path.basename(urlparse(url).path)):
+                extract = QMessageBox.question(self, self.tr.t("add_url_title"),
+                                               self.tr.t("extract_prompt")) == QMessageBox.Yes
             if self.manager:
                 try:
                     # Get number of threads from settings
                     num_threads = self.manager.config.get("threads_per_download", 4)
                     
-                    # Fix the callback signatures to handle arguments properly
-                    key = self.manager.create_multi_threaded_download(
+                    # Fix the callback signatures to handle arguments properly,
+                    # the server is probed in the background
+                    key = self.manager.add_download_async(
                         url,
                         progress_callback=lambda downloaded, speed: self.on_download_progress(url, downloaded, speed),
                         complete_callback=lambda url=url: self.on_download_complete(url),
                         error_callback=lambda error=None: self.on_download_error(url, error),
-                        num_threads=num_threads
+                        num_threads=num_threads,
+                        checksum=checksum.strip() or None,
+                        extract=extract,
+                        mirrors=mirrors
                     )
                     
                     if key:
@@ -677,6 +773,20 @@ class FDMQtMain(QMainWindow):
                     else:
                         QMessageBox.critical(self, self.tr.t("error"), f"{self.tr.t('download_failed')}: {error_msg}")
 
+    def add_many(self, urls):
+        """Add pasted URLs in bulk, they are probed in the background"""
+        if not self.manager:
+            return
+        keys = self.manager.add_downloads(
+            urls,
+            progress_callback=self.on_download_progress,
+            complete_callback=lambda url: self.on_download_complete(url),
+            error_callback=lambda url, error=None: self.on_download_error(url, error),
+            num_threads=self.manager.config.get("threads_per_download", 4)
+        )
+        self.add_downloads_to_tree(keys)
+        QMessageBox.information(self, self.tr.t("success"), f"{self.tr.t('downloads_added')}: {len(keys)}")
+
     def on_start(self):
         """Start selected downloads"""
         selected_items = self.tree.selectedItems()
@@ -687,12 +797,8 @@ class FDMQtMain(QMainWindow):
             url = item.data(0, Qt.UserRole)
             if url and self.manager:
                 try:
-                    if "threads" in self.manager.downloads[url]:
-                        # Multi-threaded download
-                        self.manager.start_multi_threaded_download(url)
-                    else:
-                        # Single-threaded download
-                        self.manager.start_download(url)
+                    # Queued through the scheduler, which handles both download kinds
+                    self.manager.start_download(url)
                 except Exception as e:
                     self.ui_message_queue.put_message(url, "error", f"{self.tr.t('start_failed')}: {str(e)}")
 
@@ -734,6 +840,16 @@ class FDMQtMain(QMainWindow):
                 except Exception as e:
                     self.ui_message_queue.put_message(url, "error", f"{self.tr.t('remove_failed')}: {str(e)}")
 
+    def on_priority_changed(self, name):
+        """Apply a priority to the selected downloads"""
+        if not self.manager:
+            return
+            
+        for item in self.tree.selectedItems():
+            url = item.data(0, Qt.UserRole)
+            if url:
+                self.manager.set_priority(url, PRIORITIES[name])
+
     def on_settings(self):
         """Open settings dialog"""
         if self.manager:
@@ -851,6 +967,35 @@ class FDMQtMain(QMainWindow):
                 
                 # Update status
                 item.setText(4, download.get("status", "unknown").capitalize())
+                tooltip = []
+                retries, refetched = self.manager.get_retry_stats(url)
+                if retries:
+                    tooltip.append(f"Retries: {retries} ({self.format_size(refetched)} re-fetched)")
+                writer_stats = self.manager.get_writer_stats(url)
+                if writer_stats:
+                    tooltip.append(f"Write buffer: {self.format_size(writer_stats['buffered'])} / "
+                                   f"{self.format_size(writer_stats['buffer_size'])}, "
+                                   f"latency {writer_stats['write_latency'] * 1000:.0f} ms")
+                address_stats = self.manager.get_address_stats(url)
+                if address_stats:
+                    tooltip.append("Addresses: " + ", ".join(
+                        f"{address} x{connections} ({self.format_speed(speed)})"
+                        for address, (connections, speed) in address_stats.items()))
+                history = self.manager.get_connection_history(url)
+                if history:
+                    tooltip.append(f"Connections: {history[-1][1]} (auto: " + ", ".join(
+                        f"{connections} {reason}" for _, connections, rate, reason in history[-6:]) + ")")
+                mirror_stats = self.manager.get_mirror_stats(url)
+                if mirror_stats:
+                    tooltip.append("Mirrors: " + ", ".join(
+                        f"{urlparse(mirror).netloc} x{connections} ({self.format_speed(speed)})"
+                        + (" failing" if failed else "")
+                        for mirror, (connections, speed, failed) in mirror_stats.items()))
+                extract_stats = self.manager.get_extract_stats(url)
+                if extract_stats:
+                    tooltip.append(f"Extraction: {extract_stats['status']} {extract_stats['progress'] * 100:.0f}% "
+                                   f"({extract_stats['files']} files)")
+                item.setToolTip(4, "\n".join(tooltip))
                 
                 # Update color based on status with proper text contrast
                 status = download.get("status", "unknown")